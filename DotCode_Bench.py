@@ -0,0 +1,195 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import DotCode_Final as app
+import DotCode_Sim as sim
+
+DEVICE_COUNTS = (1, 4, 16, 64)
+DOTS_PER_PORT = 4        # Simulated Dots sharing each serial port
+BUS_LATENCY = 0.0005     # Seconds each simulated transaction holds its bus
+SETTLE_BAND = 0.5        # °C around the target that counts as settled
+STOP_WARMUP = 0.5        # Seconds a preset runs before the stop latency is measured
+
+# The custom cycles from Apply Settings, benchmarked alongside the presets
+CUSTOM_CYCLES = app.cycle_preset(2, 40, 25, 30, 30, 0.3)
+
+def percentile(values, fraction):
+    """Returns the value below which the given fraction of values fall."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def bus_transactions(devices):
+    buses = {id(device.bus): device.bus for device in devices if hasattr(device, "bus")}
+    return sum(bus.transactions for bus in buses.values())
+
+def connect(count, simulated, latency, virtual):
+    """Points the app at count devices, on a VirtualClock when virtual is set."""
+    app.use_clock(app.VirtualClock() if virtual else app.SystemClock())
+    app.reset_session()
+    if simulated:
+        ports = max(1, count // DOTS_PER_PORT)
+        app.devices = sim.discover_devices(count, ports, latency, clock=app.clock, seed=0)
+    else:
+        app.devices = app.connect_devices(count)
+    app.stop_event.clear()
+
+def settling_tracker():
+    """
+    Returns a tick listener and a function giving each target phase's settling time: seconds into
+    the phase after which every device stayed within SETTLE_BAND, or None if the phase ended outside it.
+    """
+    last_outside = {}
+    inside_at_end = {}
+
+    def listener(phase, elapsed):
+        if phase["target"] is None:
+            return
+        inside = True
+        for device in app.devices:
+            temperature = app.sampler.latest(device, max_age=float("inf"))
+            if temperature is None or abs(temperature - phase["target"]) > SETTLE_BAND:
+                inside = False
+                break
+        last_outside.setdefault(id(phase), 0.0)
+        if not inside:
+            last_outside[id(phase)] = elapsed
+        inside_at_end[id(phase)] = inside
+
+    def settling_times():
+        return [last_outside[key] if inside_at_end[key] else None for key in last_outside]
+    return listener, settling_times
+
+def bench_preset(name, preset, count, simulated=True, latency=BUS_LATENCY):
+    """Runs one preset on count devices and returns its measurements."""
+    connect(count, simulated, latency, virtual=simulated)
+    listener, settling_times = settling_tracker()
+    app.tick_listeners.append(listener)
+    started = app.clock.monotonic()
+    wall_start = time.perf_counter()
+    try:
+        app.run_preset(preset)
+    finally:
+        app.tick_listeners.remove(listener)
+    wall_time = time.perf_counter() - wall_start
+    session_time = app.clock.monotonic() - started
+    tick_times = list(app.engine_stats["recent_tick_times"])
+    hits, misses, transactions = app.shadow_stats()
+    if simulated:
+        transactions = bus_transactions(app.devices)
+    else:
+        transactions += app.sampler.reads
+    settling = settling_times()
+    settled = [seconds for seconds in settling if seconds is not None]
+    return {
+        "preset": name,
+        "devices": count,
+        "ticks": app.engine_stats["ticks"],
+        "tick_p50": percentile(tick_times, 0.50),
+        "tick_p99": percentile(tick_times, 0.99),
+        "missed_deadlines": app.engine_stats["missed"],
+        "scheduler": app.engine_stats["scheduler"],
+        "tick_rate": app.engine_stats["tick_rate"],
+        "transactions_per_second": transactions / session_time if session_time else None,
+        "writes_skipped": hits,
+        "staleness_mean": app.sampler.staleness_total / app.sampler.consumed if app.sampler.consumed else None,
+        "staleness_max": app.sampler.max_staleness,
+        "port_utilization": {name: report["utilization"] for name, report in app.port_report().items()},
+        "time_in_band": [round(result["in_band"] / result["duration"], 3) for result in app.engine_stats["time_in_band"]],
+        "settling_time": max(settled) if settled else None,
+        "unsettled_phases": len(settling) - len(settled),
+        "session_seconds": session_time,
+        "wall_seconds": wall_time,
+    }
+
+def bench_stop(count, simulated=True, latency=BUS_LATENCY):
+    """Starts a preset in real time, calls stop() and measures the seconds until every device is off."""
+    connect(count, simulated, latency, virtual=False)
+    app.start_preset("carpal_tunnel")
+    time.sleep(STOP_WARMUP)
+    started = time.perf_counter()
+    app.stop()
+    if simulated:
+        while not all(device.registers.is_off() for device in app.devices):
+            time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    app.cycle_thread.join()
+    return {"preset": "stop", "devices": count, "stop_latency": elapsed,
+            "stop_deadline": app.STOP_DEADLINE, "within_deadline": elapsed <= app.STOP_DEADLINE}
+
+def bench_engine_stop(count, simulated=True, latency=BUS_LATENCY):
+    """
+    Like bench_stop(), but through the engine the GUI, headless runs and the daemon stop with: starts a session,
+    calls request_stop() and measures the seconds until every device is off.
+    """
+    connect(count, simulated, latency, virtual=False)
+    record_dir, app.RECORD_DIR = app.RECORD_DIR, ""  # No session files from benchmarks
+    try:
+        app.engine.start()
+        session = app.engine.start_session("carpal_tunnel")
+        time.sleep(STOP_WARMUP)
+        started = time.perf_counter()
+        stopped = app.engine.request_stop()
+        if simulated:
+            while not all(device.registers.is_off() for device in app.devices):
+                time.sleep(0.001)
+        else:
+            stopped.result()
+        elapsed = time.perf_counter() - started
+        while session.running():
+            time.sleep(0.01)
+        app.engine.shutdown()
+    finally:
+        app.RECORD_DIR = record_dir
+    return {"preset": "engine_stop", "devices": count, "stop_latency": elapsed,
+            "stop_deadline": app.STOP_DEADLINE, "within_deadline": elapsed <= app.STOP_DEADLINE}
+
+def run_benchmarks(counts=DEVICE_COUNTS, names=None, simulated=True, latency=BUS_LATENCY):
+    """Runs every preset (plus the custom cycles) and both stop benchmarks for each device count."""
+    catalogue = dict(app.presets, custom_cycles=CUSTOM_CYCLES)
+    names = names or list(catalogue)
+    results = []
+    for count in counts:
+        for name in names:
+            print(f"Benchmarking {name} on {count} device(s)...", file=sys.stderr)
+            results.append(bench_preset(name, catalogue[name], count, simulated, latency))
+        results.append(bench_stop(count, simulated, latency))
+        results.append(bench_engine_stop(count, simulated, latency))
+    app.use_clock(app.SystemClock())
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "simulated": simulated,
+        "bus_latency": latency if simulated else None,
+        "startup": app.startup_report(),
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DotCode presets on simulated or real Dots.")
+    parser.add_argument("--devices", default=",".join(str(count) for count in DEVICE_COUNTS),
+                        help="comma separated device counts (default: %(default)s)")
+    parser.add_argument("--presets", help="comma separated preset names (default: all)")
+    parser.add_argument("--latency", type=float, default=BUS_LATENCY, help="simulated seconds per transaction")
+    parser.add_argument("--real", action="store_true", help="use real Dots in real time instead of simulated ones")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.devices.split(",")]
+    names = args.presets.split(",") if args.presets else None
+    report = run_benchmarks(counts, names, not args.real, args.latency)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    late = [result["devices"] for result in report["results"] if result.get("within_deadline") is False]
+    if late:
+        sys.exit(f"Stop took longer than {app.STOP_DEADLINE}s with {late} device(s)")
+
+if __name__ == "__main__":
+    main()
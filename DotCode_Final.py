@@ -1,20 +1,33 @@
 import time
+import_started = time.perf_counter()  # Startup timing starts when this module begins importing
+import os
+import math
+import sys
+import json
+import signal
+import hashlib
+import argparse
+import queue
+import asyncio
 import threading
-import tkinter as tk
-from tkinter import ttk
+import socketserver
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from datafeel.device import ThermalMode, LedMode, VibrationMode, discover_devices
+from DotCode_Telemetry import Telemetry, SessionRecorder
+
+numpy = None  # Optional, imported on the first PI step: the controller bank vectorizes with it and loops over its arrays without
 
 # Global Variables
-presets = {}
 stop_event = threading.Event()
 cycle_thread = None
 devices = []
-prev_error = {}       # Store previous error values for each device for better control
-integral_term = {}    # Store integral error accumulation for each device
 
 # UI Elements (to be initialized later)
 root = None
 status_label = None
+devices_label = None
 skin_temp_label = None
 preset_entry = None
 preset_combobox = None
@@ -23,48 +36,673 @@ low_temp_entry = None
 heat_duration_entry = None
 cold_duration_entry = None
 cycle_entry = None
+dots_entry = None
 vib_combobox = None
 
-def get_skin_temperature():
-    """Continuously updates the skin temperature reading every 0.5 seconds for real-time accuracy."""
-    for device in devices:
+class SystemClock:
+    """Real time. Every timing path goes through the module's clock so it can be swapped out."""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        """Waits up to timeout seconds for event; returns True if it was set."""
+        return event.wait(timeout)
+
+class VirtualClock:
+    """
+    Simulated time that jumps forward instead of sleeping, for running presets faster than real time.
+    Only one thread may sleep on it, so presets run on it through run_preset() rather than the engine.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.lock = threading.Lock()
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += max(0.0, seconds)
+
+    def wait(self, event, timeout):
+        if not event.is_set():
+            self.sleep(timeout)
+        return event.is_set()
+
+clock = SystemClock()
+
+startup = {}  # Seconds from import_started at which each startup milestone was first reached
+
+def mark_startup(milestone):
+    """Records the first time a startup milestone is reached; later calls are ignored."""
+    if milestone not in startup:
+        startup[milestone] = time.perf_counter() - import_started
+
+def startup_report():
+    """
+    Returns the seconds spent in each startup stage reached so far: import, time_to_window (from the start
+    of the import until the window is up), discovery, connection (ports, engine), first_frame and first_tick
+    (both from the preset starting), and time_to_first_tick from the start of the import.
+    """
+    stages = (("import", None, "imported"), ("time_to_window", None, "window"), ("discovery", "discovery_started", "discovered"),
+              ("connection", "discovered", "connected"), ("first_frame", "preset_started", "first_frame"),
+              ("first_tick", "preset_started", "first_tick"), ("time_to_first_tick", None, "first_tick"))
+    return {name: startup[end] - startup.get(begin, 0.0) for name, begin, end in stages
+            if end in startup and (begin is None or begin in startup)}
+
+def print_startup_report():
+    print("Startup: " + ", ".join(f"{name.replace('_', ' ')} {seconds * 1000:.0f} ms" for name, seconds in startup_report().items()))
+
+def use_clock(new_clock):
+    """Switches every timing path over to new_clock, e.g. a VirtualClock."""
+    global clock
+    clock = new_clock
+
+# Order in which the fields of a device command frame are written: modes first, then values
+FRAME_FIELDS = ("thermal_mode", "vibration_mode", "led_mode", "thermal_intensity", "vibration_intensity", "global_led")
+
+def device_frame(thermal=None, vibration=None, led=None):
+    """Builds a device command frame; fields left as None are not touched on the device."""
+    frame = {}
+    if thermal is not None:
+        frame["thermal_mode"] = ThermalMode.MANUAL
+        frame["thermal_intensity"] = thermal
+    if vibration is not None:
+        frame["vibration_mode"] = VibrationMode.MANUAL if vibration > 0 else VibrationMode.OFF
+        frame["vibration_intensity"] = vibration
+    if led is not None:
+        frame["led_mode"] = LedMode.GLOBAL_MANUAL
+        frame["global_led"] = tuple(led)
+    return frame
+
+OFF_FRAME = {
+    "thermal_mode": ThermalMode.OFF,
+    "vibration_mode": VibrationMode.OFF,
+    "thermal_intensity": 0.0,
+    "vibration_intensity": 0.0,
+    "global_led": (0, 0, 0),
+}
+
+class ShadowRegisters:
+    """
+    Wraps device.registers and skips writes that match the last value the device acknowledged.
+    Backends whose registers provide write_frame(fields) get a whole command frame in one
+    multi-register transaction; otherwise the changed fields are written one by one.
+    """
+
+    def __init__(self, registers, port=None):
+        self.registers = registers
+        self.port = port or Port("default")
+        self.values = {}
+        self.hits = 0          # Writes skipped because the device already holds the value
+        self.misses = 0        # Writes actually sent over the bus
+        self.transactions = 0  # Bus round trips used to send them
+        self.lock = threading.RLock()  # Keeps the cache in step with the device, whichever thread asks
+
+    def _write(self, name, value, write, *args, urgent=False):
+        with self.lock:
+            if name in self.values and self.values[name] == value:
+                self.hits += 1
+                return
+            self.misses += 1
+            self.transactions += 1
+            self.values.pop(name, None)  # Unknown until the device acknowledges the write
+            self.port.transaction(write, *args, urgent=urgent)
+            self.values[name] = value
+
+    def apply_state(self, frame, urgent=False):
+        """
+        Sends only the fields of a command frame that differ from what the device holds.
+        An urgent frame (the off command) gets the bus ahead of every transaction waiting for it.
+        """
+        with self.lock:
+            changed = {}
+            for name in FRAME_FIELDS:
+                if name not in frame:
+                    continue
+                if name in self.values and self.values[name] == frame[name]:
+                    self.hits += 1
+                else:
+                    changed[name] = frame[name]
+            if not changed:
+                return
+            if len(changed) > 1 and hasattr(self.registers, "write_frame"):
+                self.misses += len(changed)
+                self.transactions += 1
+                for name in changed:
+                    self.values.pop(name, None)
+                self.port.transaction(self.registers.write_frame, changed, urgent=urgent)
+                self.values.update(changed)
+            else:
+                for name, value in changed.items():
+                    args = value if name == "global_led" else (value,)
+                    self._write(name, value, getattr(self.registers, "set_" + name), *args, urgent=urgent)
+            mark_startup("first_frame")
+
+    def set_thermal_mode(self, mode):
+        self._write("thermal_mode", mode, self.registers.set_thermal_mode, mode)
+
+    def set_thermal_intensity(self, intensity):
+        self._write("thermal_intensity", intensity, self.registers.set_thermal_intensity, intensity)
+
+    def set_vibration_mode(self, mode):
+        self._write("vibration_mode", mode, self.registers.set_vibration_mode, mode)
+
+    def set_vibration_intensity(self, intensity):
+        self._write("vibration_intensity", intensity, self.registers.set_vibration_intensity, intensity)
+
+    def set_led_mode(self, mode):
+        self._write("led_mode", mode, self.registers.set_led_mode, mode)
+
+    def set_global_led(self, r, g, b):
+        self._write("global_led", (r, g, b), self.registers.set_global_led, r, g, b)
+
+    def get_skin_temperature(self):
+        with self.lock:
+            return self.port.transaction(self.registers.get_skin_temperature)
+
+    def invalidate(self):
+        """Forgets every cached value so the next write of each register goes to the device."""
+        self.values.clear()
+
+    def __getattr__(self, name):
+        return getattr(self.registers, name)
+
+class Port:
+    """
+    A serial port or hub. Its bus is half-duplex, so the Dots on it share one transaction at a time;
+    urgent transactions (the off broadcast) get it before any other waiting one. The port counts
+    those transactions and how long they kept the bus busy.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.devices = []
+        self.turn = threading.Condition()
+        self.busy = False
+        self.urgent = 0  # Urgent transactions waiting for the bus
+        self.reset()
+
+    def transaction(self, call, *args, urgent=False):
+        """Runs call(*args) with the bus to itself and returns its result."""
+        with self.turn:
+            if urgent:
+                self.urgent += 1
+                while self.busy:
+                    self.turn.wait()
+                self.urgent -= 1
+            else:
+                while self.busy or self.urgent:
+                    self.turn.wait()
+            self.busy = True
+        started = time.perf_counter()
         try:
-            temperature = device.registers.get_skin_temperature()
-            skin_temp_label.config(text=f"Skin Temperature: {temperature:.1f} °C")
-        except Exception as e:
-            skin_temp_label.config(text="Error reading temperature")
-    root.after(500, get_skin_temperature)
+            return call(*args)
+        finally:
+            with self.turn:
+                self.busy = False
+                self.transactions += 1
+                self.busy_time += time.perf_counter() - started
+                self.turn.notify_all()
+
+    def utilization(self):
+        """Fraction of the wall time since the last reset that the bus spent in a transaction."""
+        elapsed = time.perf_counter() - self.since
+        return self.busy_time / elapsed if elapsed > 0 else 0.0
+
+    def reset(self):
+        self.transactions = 0
+        self.busy_time = 0.0
+        self.since = time.perf_counter()
+
+ports = {}  # Port name -> Port, filled in as devices are assigned
+
+def port_of(device):
+    """Returns the serial port a device is attached to, or "default" if the backend doesn't say."""
+    return getattr(device, "port", None) or "default"
+
+def port_for(device):
+    """Returns the Port a device is attached to, assigning the device to it on first use."""
+    name = port_of(device)
+    if name not in ports:
+        ports[name] = Port(name)
+    if device not in ports[name].devices:
+        ports[name].devices.append(device)
+    return ports[name]
+
+def assign_ports(devices):
+    """Groups devices by the port they were discovered on and returns {port name: [devices]}."""
+    for device in devices:
+        port_for(device)
+    return {name: list(port.devices) for name, port in ports.items()}
+
+def port_report():
+    """Returns {port name: {"devices", "transactions", "busy_time", "utilization"}} for every port."""
+    return {name: {"devices": len(port.devices), "transactions": port.transactions,
+                   "busy_time": port.busy_time, "utilization": port.utilization()}
+            for name, port in ports.items()}
+
+shadow_registers = {}  # Shadow register layer for each device
+
+def registers_for(device):
+    """Returns the shadow register layer for a device, creating it on first use."""
+    if device not in shadow_registers:
+        shadow_registers[device] = ShadowRegisters(device.registers, port_for(device))
+    return shadow_registers[device]
+
+def shadow_stats():
+    """Returns (hits, misses, transactions) summed over every device's shadow registers."""
+    hits = sum(regs.hits for regs in shadow_registers.values())
+    misses = sum(regs.misses for regs in shadow_registers.values())
+    transactions = sum(regs.transactions for regs in shadow_registers.values())
+    return hits, misses, transactions
+
+IO_WORKERS_PER_PORT = 1  # The bus carries one transaction at a time, so ports are the unit of parallelism
+TICK_DEADLINE = 1.0      # Seconds a tick waits for every device before reporting it as missed
+
+class DeviceIO:
+    """Fans a tick's per-device commands out over a worker and queue of its own for each serial port."""
+
+    def __init__(self, workers_per_port=IO_WORKERS_PER_PORT):
+        self.workers_per_port = workers_per_port
+        self.pools = {}
+        self.pending = {}  # Last command submitted for each device
+        self.missed = 0    # Device ticks that missed their deadline so far
+        self.dropped = 0   # Queued commands cancelled by a stop before they ran
+        self.lock = threading.Lock()
+
+    def pool_for(self, device):
+        port = port_of(device)
+        with self.lock:
+            if port not in self.pools:
+                self.pools[port] = ThreadPoolExecutor(max_workers=self.workers_per_port, thread_name_prefix=f"io-{port}")
+            return self.pools[port]
+
+    def run(self, devices, command, deadline=TICK_DEADLINE):
+        """
+        Runs command(device) for every device in parallel and waits at most deadline seconds.
+        Returns the devices that missed the deadline, including any still busy with an earlier tick.
+        """
+        futures = {}
+        missed = []
+        for device in devices:
+            future = self.submit(device, command)
+            if future is None:
+                missed.append(device)
+            else:
+                futures[future] = device
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            if future.cancelled():
+                self.dropped += 1  # Dropped by stop(), not an error
+            elif future.exception() is not None:
+                print(f"Error on device {futures[future]}:", future.exception())
+        missed.extend(futures[future] for future in not_done)
+        self.missed += len(missed)
+        return missed
+
+    def submit(self, device, command):
+        """
+        Queues command(device) on the pool for the device's port and returns its future,
+        or None if the device is still busy with an earlier command.
+        """
+        previous = self.pending.get(device)
+        if previous is not None and not previous.done():
+            return None  # Don't queue a second command behind one that is still stuck
+        future = self.pool_for(device).submit(command, device)
+        self.pending[device] = future
+        return future
 
-def calculate_thermal_intensity(device, target_temp):
-    """Enhanced PI control for accurate temperature regulation with adaptive damping."""
-    global prev_error, integral_term
-    if device not in prev_error:
-        prev_error[device] = 0
-        integral_term[device] = 0
+    def cancel_pending(self, group=None):
+        """Drops every queued command, or those for a group of devices, that hasn't started running yet."""
+        for device, future in list(self.pending.items()):
+            if group is None or device in group:
+                future.cancel()
 
-    current_temp = device.registers.get_skin_temperature()
-    error = target_temp - current_temp
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.pools.clear()
+        self.pending.clear()
 
-    if abs(error) > 5:
-        Kp = 0.3  
-        Ki = 0.02  
+device_io = DeviceIO()
+
+def for_each_device(command, deadline=TICK_DEADLINE, group=None):
+    """Runs command(device) on all devices (or a group of them) at once and reports the ones that missed the deadline."""
+    missed = device_io.run(devices if group is None else group, command, deadline)
+    if missed:
+        print(f"{len(missed)} device(s) missed the {deadline}s tick deadline:", missed)
+    return missed
+
+SAMPLE_PERIOD = 0.5     # Seconds between skin temperature reads of each device
+MAX_READING_AGE = 0.75  # Readings older than this many seconds count as missing
+
+class SkinTemperatureSampler:
+    """
+    Keeps the latest timestamped skin temperature reading of every device, read every period by the
+    engine's sampling task on its own I/O pools, so the PI controller, the UI and loggers share one
+    stream of sensor reads.
+    """
+
+    def __init__(self, period=SAMPLE_PERIOD):
+        self.period = period
+        self.readings = {}  # device -> (temperature, clock.monotonic() of the read)
+        self.reads = 0
+        self.consumed = 0           # Readings handed to consumers
+        self.staleness_total = 0.0  # Summed age of those readings, in seconds
+        self.max_staleness = 0.0
+        self.lock = threading.Lock()
+        self.io = DeviceIO()
+
+    def read(self, device):
+        """Reads a device now, publishes the reading and returns it."""
+        temperature = registers_for(device).get_skin_temperature()
+        with self.lock:
+            self.readings[device] = (temperature, clock.monotonic())
+            self.reads += 1
+        return temperature
+
+    def latest(self, device, max_age=MAX_READING_AGE):
+        """Returns the cached temperature of a device, or None if there is none younger than max_age."""
+        with self.lock:
+            reading = self.readings.get(device)
+        if reading is None or clock.monotonic() - reading[1] > max_age:
+            return None
+        return reading[0]
+
+    def consume(self, device, max_age=MAX_READING_AGE):
+        """Returns the cached temperature of a device for a consumer, counting its age, or None if it is stale."""
+        with self.lock:
+            reading = self.readings.get(device)
+            if reading is None or clock.monotonic() - reading[1] > max_age:
+                return None
+            age = clock.monotonic() - reading[1]
+            self.consumed += 1
+            self.staleness_total += age
+            self.max_staleness = max(self.max_staleness, age)
+        return reading[0]
+
+    def reset(self):
+        """Forgets every reading and counter."""
+        with self.lock:
+            self.readings.clear()
+            self.reads = self.consumed = 0
+            self.staleness_total = self.max_staleness = 0.0
+
+sampler = SkinTemperatureSampler()
+
+def get_skin_temperature():
+    """Continuously shows the latest sampled skin temperature of every device every 0.5 seconds."""
+    temperatures = [sampler.latest(device) for device in devices]
+    if not temperatures:
+        text = "Skin Temperature: -- °C"
+    elif None in temperatures:
+        text = "Error reading temperature"
+    elif len(temperatures) <= 4:
+        text = "Skin Temperature: " + ", ".join(f"{temperature:.1f}" for temperature in temperatures) + " °C"
     else:
-        Kp = 0.15  
-        Ki = 0.005  
+        text = f"Skin Temperature: {min(temperatures):.1f} to {max(temperatures):.1f} °C"
+    update_widget("skin_temp_label", text=text)
+    root.after(500, get_skin_temperature)
 
-    integral_term[device] += error
-    integral_term[device] = max(min(integral_term[device], 10), -10)
-    intensity = Kp * error + Ki * integral_term[device]
-    intensity = max(-1.0, min(1.0, intensity))
-    prev_error[device] = error
-    return intensity
+# PI gain schedule: the far gains apply while the error is larger than GAIN_SCHEDULE_ERROR degrees
+KP_FAR, KI_FAR = 0.3, 0.02
+KP_NEAR, KI_NEAR = 0.15, 0.005
+GAIN_SCHEDULE_ERROR = 5.0
+INTEGRAL_LIMIT = 10.0
+INTEGRAL_PERIOD = 1.0  # The integral gains were tuned for one PI step a second; longer steps integrate more
 
-def apply_settings():
-    """Applies user-selected settings and starts the cycle process in a separate thread."""
-    global cycle_thread, stop_event
-    if cycle_thread and cycle_thread.is_alive():
-        return
+class ControllerBank:
+    """
+    Enhanced PI control for accurate temperature regulation with adaptive damping, for many devices at once.
+    Gains, errors, integrals and outputs live in one contiguous array each, indexed by a slot per device,
+    and every controller of a tick's group is updated in a single call: vectorized with numpy when it is
+    installed, a loop over the arrays otherwise.
+    """
+
+    COLUMNS = ("kp_far", "ki_far", "kp_near", "ki_near", "integral_limit", "error", "integral", "output")
+
+    def __init__(self):
+        self.slots = {}  # Device identity -> index into every column, so a reconnected Dot keeps its controller
+        self.columns = {name: array("d") for name in self.COLUMNS}
+        self.lock = threading.Lock()
 
+    def slot(self, device):
+        """Returns a device's index, giving it a controller on first use with its tuned gains, or the defaults."""
+        key = identity_of(device)
+        index = self.slots.get(key)
+        if index is None:
+            index = self.slots[key] = len(self.slots)
+            gains = dict(kp_far=KP_FAR, ki_far=KI_FAR, kp_near=KP_NEAR, ki_near=KI_NEAR, integral_limit=INTEGRAL_LIMIT,
+                         error=0.0, integral=0.0, output=0.0)
+            gains.update(tuning.get(key, {}).get("gains", {}))
+            for name in self.COLUMNS:
+                self.columns[name].append(gains[name])
+        return index
+
+    def update(self, group, target, readings, dt=None):
+        """
+        Runs one PI step for every device of group towards target (one for all, or a list with one per
+        device) from their readings (None where a device has no fresh reading: its controller holds its
+        output) and returns the outputs. dt gives the seconds each device's step covers, INTEGRAL_PERIOD
+        for all of them by default.
+        """
+        if dt is None:
+            dt = [INTEGRAL_PERIOD] * len(group)
+        if not isinstance(target, (list, tuple)):
+            target = [target] * len(group)
+        with self.lock:
+            slots = [self.slot(device) for device in group]
+            if load_numpy():
+                return self._update_vectorized(slots, target, readings, dt)
+            c = self.columns
+            for i, setpoint, reading, seconds in zip(slots, target, readings, dt):
+                if reading is None:
+                    continue
+                error = setpoint - reading
+                far = abs(error) > GAIN_SCHEDULE_ERROR
+                kp, ki = (c["kp_far"][i], c["ki_far"][i]) if far else (c["kp_near"][i], c["ki_near"][i])
+                integral = c["integral"][i] + error * seconds / INTEGRAL_PERIOD
+                c["integral"][i] = max(-c["integral_limit"][i], min(c["integral_limit"][i], integral))
+                c["output"][i] = max(-1.0, min(1.0, kp * error + ki * c["integral"][i]))
+                c["error"][i] = error
+            return [c["output"][i] for i in slots]
+
+    def _update_vectorized(self, slots, target, readings, dt):
+        c = {name: numpy.frombuffer(column, dtype=numpy.float64) for name, column in self.columns.items()}
+        index = numpy.array(slots, dtype=numpy.intp)
+        reading = numpy.array([numpy.nan if r is None else r for r in readings], dtype=numpy.float64)
+        fresh = ~numpy.isnan(reading)
+        index, error = index[fresh], numpy.array(target, dtype=numpy.float64)[fresh] - reading[fresh]
+        seconds = numpy.array(dt, dtype=numpy.float64)[fresh]
+        far = numpy.abs(error) > GAIN_SCHEDULE_ERROR
+        kp = numpy.where(far, c["kp_far"][index], c["kp_near"][index])
+        ki = numpy.where(far, c["ki_far"][index], c["ki_near"][index])
+        limit = c["integral_limit"][index]
+        integral = numpy.clip(c["integral"][index] + error * seconds / INTEGRAL_PERIOD, -limit, limit)
+        c["integral"][index] = integral
+        c["output"][index] = numpy.clip(kp * error + ki * integral, -1.0, 1.0)
+        c["error"][index] = error
+        return c["output"][slots].tolist()
+
+    def output(self, device):
+        return self.columns["output"][self.slot(device)]
+
+    def state(self, device):
+        """Returns (error, integral) from a device's last PI step, or None if it has never had one."""
+        index = self.slots.get(identity_of(device))
+        if index is None:
+            return None
+        return self.columns["error"][index], self.columns["integral"][index]
+
+    def snapshot(self, device):
+        """Returns a device's gains and PI state as a dict, for checkpoints."""
+        index = self.slot(device)
+        return {name: self.columns[name][index] for name in self.COLUMNS}
+
+    def restore(self, device, values):
+        """Puts back a device's gains and PI state from snapshot()."""
+        with self.lock:
+            index = self.slot(device)
+            for name in self.COLUMNS:
+                if name in values:
+                    self.columns[name][index] = values[name]
+
+    def clear(self):
+        with self.lock:
+            self.slots.clear()
+            self.columns = {name: array("d") for name in self.COLUMNS}
+
+def load_numpy():
+    """Imports numpy the first time it is needed, keeping its import off startup; returns False if it isn't installed."""
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+    return numpy is not False
+
+controllers = ControllerBank()
+
+def cached_readings(group, read_stale=True):
+    """
+    Returns each device's cached skin temperature. Stale ones are read now if read_stale, all at once over
+    the per-port I/O pools like the tick commands, else they are None.
+    """
+    if read_stale:
+        stale = [device for device in group if sampler.latest(device) is None]
+        if stale:
+            device_io.run(stale, sampler.read)
+    return [sampler.consume(device) for device in group]
+
+def update_controllers(phase, group, read_stale=True, dt=None, timeline=None):
+    """
+    Runs the PI step for a tick on every device of group that has a target at once: the phase's, or
+    the next phase's for devices the timeline has started moving towards it early.
+    """
+    targets = [phase["target"] if timeline is None else timeline.target(device) for device in group]
+    dt = dt or [INTEGRAL_PERIOD] * len(group)
+    closed = [i for i, target in enumerate(targets) if target is not None]
+    if closed:
+        group = [group[i] for i in closed]
+        controllers.update(group, [targets[i] for i in closed], cached_readings(group, read_stale), [dt[i] for i in closed])
+
+TUNING_FILE = os.environ.get("DOTCODE_TUNING_FILE", os.path.join(os.path.expanduser("~"), ".dotcode_tuning.json"))
+AUTOTUNE_STEP = 0.5         # Thermal intensity of the step applied during autotune
+AUTOTUNE_SECONDS = 90.0     # Length of the step experiment; a few time constants of a Dot on skin
+AUTOTUNE_PERIOD = 1.0       # Seconds between readings during the experiment
+AUTOTUNE_RESPONSE = 8.0     # Closed-loop time constant (s) the tuned gains aim for; SLOW_TICK steps must stay stable
+
+tuning = {}  # Device identity -> {"model": fitted thermal model, "gains": controller gains}, from TUNING_FILE
+
+def load_tuning(path=TUNING_FILE):
+    """Loads the tuned models and gains of every device tuned so far."""
+    try:
+        with open(path) as f:
+            tuning.update(json.load(f))
+    except (OSError, ValueError) as e:
+        if os.path.exists(path):
+            print(f"Could not load tuning from {path}: {e}")
+
+def save_tuning(path=TUNING_FILE):
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(tuning, f, indent=2)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Could not save tuning to {path}: {e}")
+
+def fit_thermal_model(samples, step):
+    """
+    Fits a first-order-plus-dead-time model to a step response: samples are (seconds since the step,
+    skin temperature), the first taken just before it. Returns {"ambient", "gain" (°C per unit of
+    intensity), "time_constant", "dead_time", "rms_error"}, found by a grid search over the time
+    constant and dead time with the gain solved by least squares for each.
+    """
+    ambient = samples[0][1]
+    times = [t for t, temperature in samples]
+    rises = [temperature - ambient for t, temperature in samples]
+    best = None
+    for dead_time in [i * 0.5 for i in range(21)]:
+        for time_constant in [2.0 * 1.1 ** i for i in range(50)]:
+            shape = [step * (1 - math.exp(-(t - dead_time) / time_constant)) if t > dead_time else 0.0 for t in times]
+            norm = sum(x * x for x in shape)
+            if not norm:
+                continue
+            gain = sum(x * y for x, y in zip(shape, rises)) / norm
+            sse = sum((gain * x - y) ** 2 for x, y in zip(shape, rises))
+            if best is None or sse < best[0]:
+                best = (sse, gain, time_constant, dead_time)
+    sse, gain, time_constant, dead_time = best
+    return {"ambient": ambient, "gain": gain, "time_constant": time_constant, "dead_time": dead_time,
+            "rms_error": math.sqrt(sse / len(samples))}
+
+def pi_gains(model, response=AUTOTUNE_RESPONSE):
+    """
+    Works out PI gains for a fitted model with the SIMC rules, aiming for a closed-loop time constant of
+    response seconds, and an integral limit that lets the integral alone drive the element fully.
+    """
+    closed_loop = max(response, model["dead_time"])
+    kp = model["time_constant"] / (abs(model["gain"]) * (closed_loop + model["dead_time"]))
+    integral_time = min(model["time_constant"], 4 * (closed_loop + model["dead_time"]))
+    ki = kp * INTEGRAL_PERIOD / integral_time
+    return {"kp_far": kp, "ki_far": ki, "kp_near": kp, "ki_near": ki, "integral_limit": 1.0 / ki}
+
+def autotune(group=None, step=AUTOTUNE_STEP, seconds=AUTOTUNE_SECONDS, period=AUTOTUNE_PERIOD, path=TUNING_FILE):
+    """
+    Runs a step experiment on every device of group (all devices by default) at once: reads each one at rest,
+    applies a thermal step, reads it every period for seconds, then turns it off. Fits a thermal model to each
+    response, works out its PI gains, and saves both per device identity. Returns {identity: tuning}.
+    """
+    group = list(devices if group is None else group)
+    responses = {device: [] for device in group}
+    started = clock.monotonic()
+    def read(device):
+        responses[device].append((clock.monotonic() - started, sampler.read(device)))
+    def apply_step(device):
+        with registers_for(device).lock:
+            registers_for(device).apply_state(device_frame(thermal=step))
+    set_status(f"Autotune: {step:+.2f} step for {seconds:.0f} s on {len(group)} device(s)")
+    for_each_device(read, group=group)
+    started = clock.monotonic()  # The step starts now; the rest readings count as time zero
+    for device in group:
+        responses[device] = [(0.0, temperature) for t, temperature in responses[device]]
+    for_each_device(apply_step, group=group)
+    try:
+        next_read = started
+        while next_read + period <= started + seconds and not stop_event.is_set():
+            next_read += period
+            clock.sleep(max(0.0, next_read - clock.monotonic()))
+            for_each_device(read, group=group)
+    finally:
+        stop(group)
+    results = {}
+    for device, samples in responses.items():
+        if len(samples) < 10:
+            print(f"Autotune: not enough readings from {device}")
+            continue
+        model = fit_thermal_model(samples, step)
+        if model["gain"] <= 0:  # °C per unit of intensity: positive for a Dot that responds, whichever way the step went
+            print(f"Autotune: {device} did not respond to the step")
+            continue
+        results[identity_of(device)] = tuning[identity_of(device)] = {
+            "model": model, "gains": pi_gains(model), "tuned": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        gains = results[identity_of(device)]["gains"]
+        print(f"Autotune {identity_of(device)}: {model['gain']:.1f} °C per unit, time constant {model['time_constant']:.1f} s, "
+              f"dead time {model['dead_time']:.1f} s -> Kp {gains['kp_near']:.3f}, Ki {gains['ki_near']:.4f}")
+    save_tuning(path)
+    controllers.clear()  # New controllers pick up the tuned gains
+    return results
+
+def apply_settings():
+    """Applies user-selected settings and starts the cycle process on the selected dots."""
     try:
         high_temp = float(high_temp_entry.get().strip()) if high_temp_entry.get().strip() else None
         low_temp = float(low_temp_entry.get().strip()) if low_temp_entry.get().strip() else None
@@ -73,379 +711,1073 @@ def apply_settings():
         cold_duration = int(cold_duration_entry.get().strip())
         vibration_intensity = vib_combobox.get()
     except ValueError:
-        status_label.config(text="Invalid Input: Enter numbers only.")
+        set_status("Invalid Input: Enter numbers only.")
         return
 
     if high_temp is None and low_temp is None:
-        status_label.config(text="At least one temperature must be set.")
+        set_status("At least one temperature must be set.")
         return
 
     vibration_values = {"Off": 0.0, "Low": 0.3, "Medium": 0.5, "High": 1.0}
     vibration_intensity = vibration_values.get(vibration_intensity, 0.0)
-    stop_event.clear()
-    cycle_thread = threading.Thread(target=run_cycles, args=(cycles, high_temp, low_temp, heat_duration, cold_duration, vibration_intensity), daemon=True)
-    cycle_thread.start()
+    start_selected(cycle_preset(cycles, high_temp, low_temp, heat_duration, cold_duration, vibration_intensity))
+
+def parse_dots(text):
+    """Turns a dot selection like "1-2,4" (numbered from 1; blank or "all" for every dot) into a list of devices."""
+    text = text.strip().lower()
+    if text in ("", "all"):
+        return list(devices)
+    group = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        for number in range(int(first), int(last or first) + 1):
+            if not 1 <= number <= len(devices):
+                raise ValueError(f"There is no dot {number}")
+            if devices[number - 1] not in group:
+                group.append(devices[number - 1])
+    return group
+
+def selected_dots():
+    """Returns the devices picked in the dots entry, or None after saying why the entry is invalid."""
+    try:
+        return parse_dots(dots_entry.get())
+    except ValueError:
+        set_status("Invalid dots: enter e.g. 1-2 or 1,3")
+        return None
+
+def start_selected(preset):
+    """
+    Starts a preset as its own session on the selected dots. If the same preset was cut short on them
+    within RESUME_WINDOW, asks whether to resume it or start from the beginning.
+    """
+    from tkinter import messagebox
+    if not devices:
+        set_status("No dots connected yet.")
+        return
+    group = selected_dots()
+    if group is None:
+        return
+    if isinstance(preset, str):
+        preset = presets[preset]
+    resume = False
+    checkpoint = load_checkpoint(preset, group)
+    if checkpoint is not None:
+        resume = messagebox.askyesnocancel("Resume session?",
+            f"{checkpoint['name']} was interrupted on these dots {describe_checkpoint(checkpoint)}."
+            f"\n\nYes resumes it where it stopped; No starts {preset['name']} from the beginning.")
+        if resume is None:
+            return
+    if engine.start_session(preset, group, resume=resume) is None:
+        set_status("Those dots are already running a session.")
+
+def stop_selected():
+    """Stops the sessions on the selected dots, or everything when all dots are selected."""
+    if not devices:
+        return
+    group = selected_dots()
+    if group is None:
+        return
+    if len(group) == len(devices):
+        engine.request_stop()
+    else:
+        engine.stop_devices(group)
+
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+
+def phase(status, duration, target=None, thermal=None, vibration=None, led=None, tick=1.0):
+    """
+    Describes one phase of a preset. target is a skin temperature held by the PI controller,
+    thermal an open-loop intensity; fields left as None are not touched on the devices.
+    """
+    return {"status": status, "duration": duration, "target": target, "thermal": thermal,
+            "vibration": vibration, "led": led, "tick": tick}
 
-def run_cycles(cycles, high_temp, low_temp, heat_duration, cold_duration, vibration_intensity):
-    """Handles the heating and cooling cycles in a controlled loop."""
-    root.after(0, lambda: status_label.config(text=f"Status: Running {cycles} Cycles"))
+presets = {
+    # Max cold for 2.5 minutes, then heating to 40°C for 10 minutes, red LED throughout.
+    "carpal_tunnel": {"name": "TheraBand Carpal Tunnel", "phases": [
+        phase("Carpal Tunnel: Max Cold for 2.5 minutes", 150, thermal=-1.0, vibration=0.0, led=RED),
+        phase("Carpal Tunnel: Heating at 40°C for 10 minutes", 600, target=40, vibration=0.0, led=RED),
+    ]},
+    # Max cold for 10 seconds, then heating to 40°C for 15 seconds, red LED throughout.
+    "carpal_tunnel_demo": {"name": "TheraBand Carpal Tunnel Demo", "phases": [
+        phase("Carpal Tunnel Demo: Max Cold for 10 seconds", 10, thermal=-1.0, vibration=0.0, led=RED),
+        phase("Carpal Tunnel Demo: Heating at 40°C for 15 seconds", 15, target=40, vibration=0.0, led=RED),
+    ]},
+    # Heat to 40°C, max cold, heat to 40°C again, 10 seconds each with vibration at 15.66 Hz and red LED.
+    "arthritis": {"name": "TheraBand Arthritis Demo", "phases": [
+        phase("Arthritis: High Heat for 10 seconds", 10, target=40, vibration=15.66, led=RED),
+        phase("Arthritis: Max Cold for 10 seconds", 10, thermal=-1.0, vibration=15.66, led=RED),
+        phase("Arthritis: High Heat for 10 seconds", 10, target=40, vibration=15.66, led=RED),
+    ]},
+    # Max heat, max cold, max heat, 2.5 minutes each with vibration at 15.66 Hz and red LED.
+    "theraband_arthritis": {"name": "TheraBand Arthritis", "phases": [
+        phase("TheraBand Arthritis: Max Heat Phase", 150, thermal=1.0, vibration=15.66, led=RED),
+        phase("TheraBand Arthritis: Max Cold Phase", 150, thermal=-1.0, vibration=15.66, led=RED),
+        phase("TheraBand Arthritis: Max Heat Phase", 150, thermal=1.0, vibration=15.66, led=RED),
+    ]},
+    # 4 intervals of 3 seconds alternating green and blue LED, each starting with a 0.2 second vibration beat.
+    "mindfulness_demo": {"name": "TheraBand Mindfulness Demo", "phases": [
+        step
+        for i in range(4)
+        for step in (phase(f"Mindfulness Demo: Interval {i+1}", 0.2, vibration=1.0, led=GREEN if i % 2 == 0 else BLUE, tick=0.2),
+                     phase(f"Mindfulness Demo: Interval {i+1}", 2.8, vibration=0.0, led=GREEN if i % 2 == 0 else BLUE, tick=0.1))
+    ]},
+    # 8.5 seconds cooling towards 0°C, vibration 0.2 for the first 7 seconds then 0.9,
+    # LED switching between blue and green every 2 seconds.
+    "therapendant_mindfulness_demo": {"name": "TheraPendant Mindfulness Demo", "phases": [
+        phase("Therapendant Mindfulness Demo", 2, target=0, vibration=0.2, led=BLUE, tick=0.1),
+        phase("Therapendant Mindfulness Demo", 2, target=0, vibration=0.2, led=GREEN, tick=0.1),
+        phase("Therapendant Mindfulness Demo", 2, target=0, vibration=0.2, led=BLUE, tick=0.1),
+        phase("Therapendant Mindfulness Demo", 1, target=0, vibration=0.2, led=GREEN, tick=0.1),
+        phase("Therapendant Mindfulness Demo", 1, target=0, vibration=0.9, led=GREEN, tick=0.1),
+        phase("Therapendant Mindfulness Demo", 0.5, target=0, vibration=0.9, led=BLUE, tick=0.1),
+    ]},
+}
+
+def cycle_preset(cycles, high_temp, low_temp, heat_duration, cold_duration, vibration_intensity):
+    """Builds a preset for the heating and cooling cycles set up in the UI."""
+    phases = []
     for i in range(cycles):
-        if stop_event.is_set():
-            break
         if high_temp is not None:
-            for device in devices:
-                try:
-                    device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                    device.registers.set_LED_mode(LedMode.GLOBAL_MANUAL)
-                    intensity = calculate_thermal_intensity(device, high_temp)
-                    device.registers.set_thermal_intensity(intensity)
-                    device.registers.set_vibration_mode(VibrationMode.MANUAL if vibration_intensity > 0 else VibrationMode.OFF)
-                    device.registers.set_vibration_intensity(vibration_intensity)
-                except Exception as e:
-                    print("Error during high temp phase:", e)
-            time.sleep(heat_duration)
-        if stop_event.is_set():
-            break
+            phases.append(phase(f"Status: Cycle {i+1} of {cycles}, heating to {high_temp}°C", heat_duration,
+                                target=high_temp, vibration=vibration_intensity))
         if low_temp is not None:
-            for device in devices:
-                try:
-                    device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                    intensity = calculate_thermal_intensity(device, low_temp)
-                    device.registers.set_thermal_intensity(intensity)
-                    device.registers.set_vibration_mode(VibrationMode.MANUAL if vibration_intensity > 0 else VibrationMode.OFF)
-                    device.registers.set_vibration_intensity(vibration_intensity)
-                except Exception as e:
-                    print("Error during low temp phase:", e)
-            time.sleep(cold_duration)
-    stop()
+            phases.append(phase(f"Status: Cycle {i+1} of {cycles}, cooling to {low_temp}°C", cold_duration,
+                                target=low_temp, vibration=vibration_intensity))
+    return {"name": "Custom Cycles", "phases": phases}
 
-def run_carpal_tunnel_cycle():
+TICK_POLICY = "skip"  # What the scheduler does after an overrun: "skip" missed ticks or "catch_up" on them
+
+class TickScheduler:
     """
-    Carpal Tunnel Cycle:
-    - Max cold (-1.0) for 2.5 minutes with red LED.
-    - Heating (target 40°C) for 10 minutes with red LED.
+    Schedules control ticks on absolute clock.monotonic() deadlines, so time spent on bus I/O
+    doesn't stretch the tick period and wall clock changes don't move phase boundaries.
     """
-    root.after(0, lambda: status_label.config(text="Carpal Tunnel: Max Cold for 2.5 minutes"))
-    for device in devices:
+
+    def __init__(self, policy=TICK_POLICY):
+        self.policy = policy
+        self.period = 1.0
+        self.next_deadline = clock.monotonic()
+        self.ticks = 0
+        self.overruns = 0      # Ticks whose deadline had already passed when the previous tick finished
+        self.skipped = 0       # Ticks dropped by the "skip" policy
+        self.jitter_total = 0.0
+        self.max_jitter = 0.0  # Largest delay between a tick's deadline and the moment it started
+
+    def reset(self, start, period):
+        """Starts a new run of ticks at the absolute time start, one every period seconds."""
+        self.next_deadline = start
+        self.period = period
+
+    def advance(self, limit=None):
+        """
+        Moves on to the next tick deadline, applying the overrun policy.
+        Returns the time to wake up at: that deadline, or limit if it comes first.
+        """
+        self.next_deadline += self.period
+        now = clock.monotonic()
+        if now > self.next_deadline:
+            self.overruns += 1
+            if self.policy == "skip":
+                missed = int((now - self.next_deadline) // self.period) + 1
+                self.skipped += missed
+                self.next_deadline += missed * self.period
+        return self.next_deadline if limit is None else min(self.next_deadline, limit)
+
+    def woke(self, wake_at):
+        """Records how late the tick meant to start at wake_at actually started."""
+        jitter = max(0.0, clock.monotonic() - wake_at)
+        self.ticks += 1
+        self.jitter_total += jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "mean_jitter": self.jitter_total / self.ticks if self.ticks else 0.0,
+            "max_jitter": self.max_jitter,
+        }
+
+
+ADAPTIVE_TICKS = os.environ.get("DOTCODE_ADAPTIVE_TICKS", "1") != "0"  # "0" ticks every device at the phase's rate
+FAST_TICK = 0.25       # Seconds between ticks of a device far from its target or near the end of a phase
+SLOW_TICK = 5.0        # Seconds between maintenance ticks of a device holding its target, or of an open-loop phase
+FAST_ERROR = 2.0       # °C of error above which a device ticks at FAST_TICK
+HOLD_BAND = 0.5        # °C of error within which a device drops to SLOW_TICK
+SETTLE_WINDOW = 5.0    # Seconds a device's error must stay put before it counts as settled wherever it is
+SETTLE_DRIFT = 0.25    # °C the error may move within SETTLE_WINDOW and still count as staying put
+BOUNDARY_WINDOW = 2.0  # Seconds before a phase ends during which every device ticks fast
+
+class TickRates:
+    """
+    Gives every device of a session its own tick interval: FAST_TICK while it is far from its target
+    or a phase boundary is near, SLOW_TICK once its reading sits inside HOLD_BAND or its error has
+    stopped changing (or the phase is open loop and nothing changes), the phase's own tick otherwise.
+    A controller that settles off target, e.g. with untuned gains, thus drops to SLOW_TICK too instead
+    of ticking fast for the rest of the phase. The session loop ticks at the fastest rate and only sends
+    commands to the devices that are due.
+    """
+
+    def __init__(self, adaptive=ADAPTIVE_TICKS):
+        self.adaptive = adaptive
+        self.next_due = {}   # device -> clock time of its next tick
+        self.last_tick = {}  # device -> clock time of its last tick
+        self.trend = {}      # device -> (clock time, error) its error has stayed near since, and whether it has settled
+        self.device_ticks = 0
+        self.started = clock.monotonic()
+
+    def period(self, phase):
+        """The loop's tick period for a phase, fast enough for the fastest device."""
+        return min(phase["tick"], FAST_TICK) if self.adaptive else phase["tick"]
+
+    def start_phase(self):
+        """Makes every device due at once, so each gets the new phase's first frame right away."""
+        self.next_due.clear()
+        self.trend.clear()
+
+    def wake(self, group):
+        """Makes the devices of group due at once, e.g. when they have just been given a new target."""
+        for device in group:
+            self.next_due.pop(device, None)
+
+    def settled(self, device, error, now):
+        """True once a device's error has stayed within SETTLE_DRIFT for SETTLE_WINDOW seconds."""
+        since, reference, settled = self.trend.get(device, (now, error, False))
+        if abs(error - reference) > SETTLE_DRIFT:
+            since, reference, settled = now, error, False  # Still moving
+        elif now - since >= SETTLE_WINDOW:
+            since, reference, settled = now, error, True
+        self.trend[device] = (since, reference, settled)
+        return settled
+
+    def interval(self, device, phase, phase_end, now, target):
+        if not self.adaptive:
+            return phase["tick"]
+        fast = min(phase["tick"], FAST_TICK)
+        if phase_end - now <= BOUNDARY_WINDOW:
+            return fast
+        if target is None:
+            return SLOW_TICK
+        reading = sampler.latest(device, max_age=float("inf"))
+        if reading is None:
+            return fast
+        error = target - reading
+        if abs(error) <= HOLD_BAND or self.settled(device, error, now):
+            return SLOW_TICK
+        return fast if abs(error) > FAST_ERROR else phase["tick"]
+
+    def due(self, group, phase, phase_end, timeline=None):
+        """Returns the devices of group due for a tick now and the seconds since each one's last tick."""
+        now = clock.monotonic()
+        slack = self.period(phase) / 2  # Tolerates a loop tick that wakes a little early or late
+        due, dt = [], []
+        for device in group:
+            if self.next_due.get(device, now) - now > slack:
+                continue
+            due.append(device)
+            dt.append(now - self.last_tick[device] if device in self.last_tick else phase["tick"])
+            self.last_tick[device] = now
+            target = phase["target"] if timeline is None else timeline.target(device)
+            self.next_due[device] = now + self.interval(device, phase, phase_end, now, target)
+        self.device_ticks += len(due)
+        return due, dt
+
+    def rate(self, group_size):
+        """Effective ticks a second per device since the session started."""
+        elapsed = clock.monotonic() - self.started
+        return self.device_ticks / (elapsed * group_size) if elapsed > 0 and group_size else 0.0
+
+PRE_TRANSITION = os.environ.get("DOTCODE_PRE_TRANSITION", "1") != "0"  # "0" only chases a target once its phase starts
+
+def transition_time(device, temperature, target):
+    """
+    Predicts the seconds a device needs at full drive to take the skin from temperature to target, from
+    its autotuned thermal model. Returns None if it has no model or can't reach the target at all.
+    """
+    model = tuning.get(identity_of(device), {}).get("model")
+    if model is None or temperature is None:
+        return None
+    drive = 1.0 if target > temperature else -1.0
+    settle = model["ambient"] + model["gain"] * drive
+    if (settle - target) * drive <= 0:
+        return None
+    ratio = (temperature - settle) / (target - settle)
+    return model["dead_time"] + model["time_constant"] * math.log(ratio) if ratio > 1 else 0.0
+
+class PhaseTimeline:
+    """
+    Knows a preset's upcoming setpoints. Near the end of each phase it switches every device whose thermal
+    model says it needs the time over to the next phase's target early, so the skin arrives there close to
+    the boundary instead of well into the next phase. It also adds up each closed-loop phase's time in band:
+    how long the devices' readings stayed within HOLD_BAND of the target they were meant to hold.
+    """
+
+    def __init__(self, phases, enabled=PRE_TRANSITION):
+        self.phases = phases
+        self.enabled = enabled
+        self.phase = None
+        self.next_target = None
+        self.phase_end = None
+        self.leading = {}  # device -> next phase's target, for devices already moving towards it
+        self.results = []  # {"status", "target", "duration", "in_band"} for every closed-loop phase run
+        self.last_tick = None
+        self.inside = 0.0  # Fraction of the devices in band at the last tick, held until the next one
+
+    def start_phase(self, index, phase_end):
+        self.finish_phase()
+        self.phase = self.phases[index]
+        self.phase_end = phase_end
+        following = self.phases[index + 1] if index + 1 < len(self.phases) else None
+        self.next_target = following["target"] if following is not None else None
+        self.leading = {}
+        self.last_tick = clock.monotonic()
+        self.inside = 0.0
+        if self.phase["target"] is not None:
+            self.results.append({"status": self.phase["status"], "target": self.phase["target"],
+                                 "duration": self.phase["duration"], "in_band": 0.0})
+
+    def target(self, device):
+        return self.leading.get(device, self.phase["target"])
+
+    def tick(self, group, read_stale=True):
+        """
+        Moves devices on to the next target when it is time, and counts the time in band since the last tick.
+        Returns the devices moved on by this tick.
+        """
+        now = clock.monotonic()
+        looking_ahead = self.enabled and self.next_target is not None and self.next_target != self.phase["target"]
+        # Only devices with a fitted thermal model can be moved on early; the others needn't be read for it
+        candidates = [device for device in group if device not in self.leading
+                      and "model" in tuning.get(identity_of(device), {})] if looking_ahead else []
+        if self.phase["target"] is not None:
+            readings = dict(zip(group, cached_readings(group, read_stale)))
+            self.results[-1]["in_band"] += (now - self.last_tick) * self.inside
+            inside = sum(reading is not None and abs(reading - self.phase["target"]) <= HOLD_BAND for reading in readings.values())
+            self.inside = inside / len(group) if group else 0.0
+        elif candidates:
+            readings = dict(zip(candidates, cached_readings(candidates, read_stale)))
+        self.last_tick = now
+        moved = []
+        for device in candidates:
+            needed = transition_time(device, readings[device], self.next_target)
+            if needed is not None and needed >= self.phase_end - now:
+                self.leading[device] = self.next_target  # Latched for the rest of the phase
+                moved.append(device)
+        return moved
+
+    def finish_phase(self):
+        """Closes the phase's time in band at its end and reports it."""
+        if self.phase is None or self.phase["target"] is None:
+            return
+        result = self.results[-1]
+        result["in_band"] += max(0.0, min(clock.monotonic(), self.phase_end) - self.last_tick) * self.inside
+        print(f"Time in band ({result['target']}±{HOLD_BAND} °C): {result['in_band']:.0f} of {result['duration']:.0f} s "
+              f"in \"{result['status']}\"")
+        self.phase = None
+
+TICK_HISTORY = 10000  # Number of recent tick durations kept for percentiles
+
+engine_stats = {"ticks": 0, "tick_time": 0.0, "max_tick_time": 0.0, "missed": 0, "scheduler": {}, "tick_rate": 0.0, "time_in_band": [],
+                "recent_tick_times": deque(maxlen=TICK_HISTORY)}
+tick_listeners = []  # Called as listener(phase, seconds into the phase) after every tick
+
+def reset_session():
+    """Clears per-device state and statistics, e.g. before driving a new set of devices."""
+    shadow_registers.clear()
+    ports.clear()
+    controllers.clear()
+    telemetry.clear()
+    sampler.reset()
+    engine_stats.update(ticks=0, tick_time=0.0, max_tick_time=0.0, missed=0, scheduler={}, tick_rate=0.0, time_in_band=[])
+    engine_stats["recent_tick_times"].clear()
+
+UI_POLL_MS = 50  # Frame period of the Tk thread: queued UI updates are applied at most this often
+
+ui_lock = threading.Lock()
+ui_pending = {}  # key -> call; only the latest call queued under a key is applied
+ui_stats = {"frames": 0, "frame_time": 0.0, "max_frame_time": 0.0, "updates": 0, "coalesced": 0}
+
+def call_in_ui(fn, key=None):
+    """
+    Queues fn to run on the Tk thread; widgets must never be touched from other threads.
+    A call queued under the same key as one still waiting replaces it, so only the latest runs.
+    """
+    with ui_lock:
+        if key is None:
+            key = object()  # Never coalesced
+        elif key in ui_pending:
+            del ui_pending[key]  # Replaced, and moved behind the calls queued since
+            ui_stats["coalesced"] += 1
+        ui_pending[key] = fn
+
+def update_widget(name, **options):
+    """Configures the named widget (e.g. "status_label") from any thread; only its latest options are applied."""
+    call_in_ui(lambda: globals()[name].config(**options), key=(name, tuple(sorted(options))))
+
+def pump_ui():
+    """Applies the UI updates queued since the last frame on the Tk thread, then schedules the next frame."""
+    global ui_pending
+    started = time.perf_counter()
+    with ui_lock:
+        pending, ui_pending = ui_pending, {}
+    for fn in pending.values():
         try:
-            device.registers.set_thermal_mode(ThermalMode.MANUAL)
-            device.registers.set_thermal_intensity(-1.0)
-            device.registers.set_global_led(255, 0, 0)
-            device.registers.set_vibration_mode(VibrationMode.OFF)
-            device.registers.set_vibration_intensity(0.0)
+            fn()
         except Exception as e:
-            print("Error in Carpal Tunnel (Cold Phase):", e)
-    start_time = time.time()
-    while time.time() - start_time < 150:
-        if stop_event.is_set():
-            stop()            
-            return
-        time.sleep(0.5)
-    
-    root.after(0, lambda: status_label.config(text="Carpal Tunnel: Heating at 40°C for 10 minutes"))
-    start_time = time.time()
-    while time.time() - start_time < 600:
-        if stop_event.is_set():
-            stop()
-            return
-        for device in devices:
-            try:
-                device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-                intensity = calculate_thermal_intensity(device, 40)
-                device.registers.set_thermal_intensity(intensity)
-                device.registers.set_global_led(255, 0, 0)
-                device.registers.set_vibration_mode(VibrationMode.OFF)
-                device.registers.set_vibration_intensity(0.0)
-            except Exception as e:
-                print("Error in Carpal Tunnel (Heating Phase):", e)
-        time.sleep(1)
-    stop()
+            print(f"UI update failed: {e}")
+    frame_time = time.perf_counter() - started
+    ui_stats["frames"] += 1
+    ui_stats["updates"] += len(pending)
+    ui_stats["frame_time"] += frame_time
+    ui_stats["max_frame_time"] = max(ui_stats["max_frame_time"], frame_time)
+    root.after(UI_POLL_MS, pump_ui)
 
-def run_carpal_tunnel_demo_cycle():
+def ui_report():
+    """Returns a one-line summary of the UI frames so far: their time, and how many updates were applied and coalesced."""
+    frames = ui_stats["frames"] or 1
+    return (f"UI: {ui_stats['frames']} frames, {ui_stats['frame_time'] / frames * 1000:.2f} ms mean, "
+            f"{ui_stats['max_frame_time'] * 1000:.2f} ms max, {ui_stats['updates']} updates applied, "
+            f"{ui_stats['coalesced']} coalesced")
+
+def set_status(text):
+    """Shows a status message from any thread, or prints it when there is no window."""
+    if root is None:
+        print(f"{time.strftime('%H:%M:%S')} {text}")
+        return
+    update_widget("status_label", text=text)
+
+def phase_command(preset, phase, session=None, timeline=None):
     """
-    Carpal Tunnel Demo Cycle:
-    - Max cold for 10 seconds with red LED.
-    - Heating (target 40°C) for 15 seconds with red LED.
+    Returns the per-device command sent on every tick of a phase, by a session if one is given.
+    Devices the timeline has moved on to the next target early are driven by their controller.
     """
-    root.after(0, lambda: status_label.config(text="Carpal Tunnel Demo: Max Cold for 10 seconds"))
-    for device in devices:
+    def stopped():
+        return stop_event.is_set() or (session is not None and session.stop_event.is_set())
+
+    def command(device):
         try:
-            device.registers.set_thermal_mode(ThermalMode.MANUAL)
-            device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-            device.registers.set_thermal_intensity(-1.0)
-            device.registers.set_global_led(255, 0, 0)
-            device.registers.set_vibration_mode(VibrationMode.OFF)
-            device.registers.set_vibration_intensity(0.0)
+            if stopped():
+                return  # Dropped: the stop path owns the bus now
+            target = phase["target"] if timeline is None else timeline.target(device)
+            if target is not None:
+                thermal = controllers.output(device)  # Worked out for the whole group by update_controllers
+            else:
+                thermal = phase["thermal"]
+            registers = registers_for(device)
+            with registers.lock:
+                # Checked again under the device lock so no tick write can land after the off command
+                if stopped():
+                    return
+                registers.apply_state(device_frame(thermal, phase["vibration"], phase["led"]))
+            record_telemetry(device, phase, target, thermal, session)
         except Exception as e:
-            print("Error in Carpal Tunnel Demo (Cold Phase):", e)
-    start_time = time.time()
-    while time.time() - start_time < 10:
-        if stop_event.is_set():
-            stop()
-            return
-        time.sleep(0.5)
-    
-    root.after(0, lambda: status_label.config(text="Carpal Tunnel Demo: Heating at 40°C for 15 seconds"))
-    start_time = time.time()
-    while time.time() - start_time < 15:
-        if stop_event.is_set():
-            stop()
-            return
-        for device in devices:
-            try:
-                device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-                intensity = calculate_thermal_intensity(device, 40)
-                device.registers.set_thermal_intensity(intensity)
-                device.registers.set_global_led(255, 0, 0)
-                device.registers.set_vibration_mode(VibrationMode.OFF)
-                device.registers.set_vibration_intensity(0.0)
-            except Exception as e:
-                print("Error in Carpal Tunnel Demo (Heating Phase):", e)
-        time.sleep(1)
-    stop()
+            print(f"Error in {preset['name']} ({phase['status']}):", e)
+    return command
+
+telemetry = Telemetry()  # Every device's per-tick samples, in bounded memory
 
-def run_arthritis_cycle():
+def record_telemetry(device, phase, target, thermal, session=None):
     """
-    Arthritis Preset Cycle:
-    - Phase 1: High heat (target 40°C) for 10 seconds with vibration at 15.66 Hz.
-    - Phase 2: Max cold (thermal intensity -1.0) for 10 seconds with vibration at 15.66 Hz.
-    - Phase 3: High heat (target 40°C) for 10 seconds with vibration at 15.66 Hz.
-    In all phases, the LED is forced red.
+    Adds a device's tick to its telemetry: latest reading, target, PI state and the frame it was sent.
+    A session with a recorder also gets it written to its session file.
     """
-    # Phase 1: High Heat for 10 seconds
-    root.after(0, lambda: status_label.config(text="Arthritis: High Heat for 10 seconds"))
-    start_time = time.time()
-    while time.time() - start_time < 10:
-        if stop_event.is_set():
-            stop()
-            return
-        for device in devices:
-            try:
-                device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                intensity = calculate_thermal_intensity(device, 40)
-                device.registers.set_thermal_intensity(intensity)
-                device.registers.set_vibration_mode(VibrationMode.MANUAL)
-                device.registers.set_vibration_intensity(15.66)
-                device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-                device.registers.set_global_led(255, 0, 0)
-            except Exception as e:
-                print("Error in Arthritis Cycle Phase 1:", e)
-        time.sleep(1)
-    
-    # Phase 2: Max Cold for 10 seconds
-    root.after(0, lambda: status_label.config(text="Arthritis: Max Cold for 10 seconds"))
-    start_time = time.time()
-    while time.time() - start_time < 10:
-        if stop_event.is_set():
-            stop()
-            return
-        for device in devices:
-            try:
-                device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                device.registers.set_thermal_intensity(-1.0)
-                device.registers.set_vibration_mode(VibrationMode.MANUAL)
-                device.registers.set_vibration_intensity(15.66)
-                device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-                device.registers.set_global_led(255, 0, 0)
-            except Exception as e:
-                print("Error in Arthritis Cycle Phase 2:", e)
-        time.sleep(1)
-    
-    # Phase 3: High Heat for 10 seconds again
-    root.after(0, lambda: status_label.config(text="Arthritis: High Heat for 10 seconds"))
-    start_time = time.time()
-    while time.time() - start_time < 10:
-        if stop_event.is_set():
-            stop()
-            return
-        for device in devices:
-            try:
-                device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                intensity = calculate_thermal_intensity(device, 40)
-                device.registers.set_thermal_intensity(intensity)
-                device.registers.set_vibration_mode(VibrationMode.MANUAL)
-                device.registers.set_vibration_intensity(15.66)
-                device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-                device.registers.set_global_led(255, 0, 0)
-            except Exception as e:
-                print("Error in Arthritis Cycle Phase 3:", e)
-        time.sleep(1)
-    stop()
+    error, integral = controllers.state(device) if target is not None else (None, None)
+    values = telemetry.record(device, clock.monotonic(), sampler.latest(device, max_age=float("inf")), target,
+                              error, integral, thermal, phase["vibration"], phase["led"])
+    if session is not None and session.recorder is not None:
+        session.recorder.record(session.indices[device], values)
 
-def run_theraband_arthritis_cycle():
-    """
-    TheraBand Arthritis Preset:
-    - Constant vibration at 15.66 Hz.
-    - Phase 1: 2.5 minutes (150 sec) of max heat (thermal intensity 1.0).
-    - Phase 2: 2.5 minutes of max cold (thermal intensity -1.0).
-    - Phase 3: 2.5 minutes of max heat (thermal intensity 1.0).
-    The LED is forced red in all phases.
-    """
-    phases = [
-        ("Max Heat", 150, 1.0),
-        ("Max Cold", 150, -1.0),
-        ("Max Heat", 150, 1.0)
-    ]
-    for phase_name, duration, intensity_value in phases:
-        root.after(0, lambda p=phase_name: status_label.config(text=f"TheraBand Arthritis: {p} Phase"))
-        start_phase = time.time()
-        while time.time() - start_phase < duration:
-            if stop_event.is_set():
-                stop()
-                return
-            for device in devices:
-                try:
-                    device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                    device.registers.set_thermal_intensity(intensity_value)
-                    device.registers.set_vibration_mode(VibrationMode.MANUAL)
-                    device.registers.set_vibration_intensity(15.66)
-                    device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-                    device.registers.set_global_led(255, 0, 0)
-                except Exception as e:
-                    print("Error in TheraBand Arthritis Cycle:", e)
-            time.sleep(1)
-    stop()
+RECORD_DIR = os.environ.get("DOTCODE_RECORD_DIR", os.path.join(os.path.expanduser("~"), "dotcode_sessions"))  # "" turns recording off
+
+CHECKPOINT_DIR = os.environ.get("DOTCODE_CHECKPOINT_DIR", os.path.join(os.path.expanduser("~"), ".dotcode_checkpoints"))
+CHECKPOINT_INTERVAL = 5.0  # Seconds between checkpoints of a running session
+RESUME_WINDOW = 600.0      # A checkpoint older than this many seconds can't be resumed
+
+def checkpoint_path(group, directory=CHECKPOINT_DIR):
+    """Returns the checkpoint file for a group of devices, named after their identities."""
+    key = hashlib.sha1(",".join(sorted(identity_of(device) for device in group)).encode()).hexdigest()[:16]
+    return os.path.join(directory, f"session-{key}.json")
+
+def save_checkpoint(session, elapsed):
+    """Saves how far into its preset a session is and every device's controller state, atomically."""
+    state = {"name": session.name, "preset": session.preset, "elapsed": elapsed, "saved": time.time(),
+             "controllers": {identity_of(device): controllers.snapshot(device) for device in session.devices}}
+    path = checkpoint_path(session.devices)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Could not checkpoint {session.name}: {e}")
+
+def load_checkpoint(preset, group, max_age=RESUME_WINDOW):
+    """Returns the checkpoint of an unfinished run of preset on group, or None if there isn't a recent one."""
+    try:
+        with open(checkpoint_path(group)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("preset") != json.loads(json.dumps(preset)) or time.time() - state.get("saved", 0) > max_age:
+        return None
+    return state
+
+def describe_checkpoint(checkpoint):
+    """Says how long ago a checkpointed run was interrupted and how far into its preset, e.g. "95 s ago, 130 s in"."""
+    return f"{time.time() - checkpoint['saved']:.0f} s ago, {checkpoint['elapsed']:.0f} s in"
+
+def clear_checkpoint(group):
+    try:
+        os.remove(checkpoint_path(group))
+    except OSError:
+        pass
+
+def open_recorder(session, directory=None):
+    """Starts a session file for a session in directory (RECORD_DIR by default), or returns None if recording is off or the file can't be made."""
+    directory = RECORD_DIR if directory is None else directory
+    if not directory:
+        return None
+    name = "".join(c if c.isalnum() else "_" for c in session.name).strip("_")
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.dtlm")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        return SessionRecorder(path, [identity_of(device) for device in session.devices], session.name)
+    except OSError as e:
+        print(f"Not recording {session.name}: {e}")
+        return None
+
+def record_tick(phase, phase_start, tick_time, missed, session=None):
+    """Adds a finished tick to engine_stats (and the session's stats) and tells the tick listeners about it."""
+    for stats in (engine_stats, session.stats) if session is not None else (engine_stats,):
+        stats["ticks"] += 1
+        stats["tick_time"] += tick_time
+        stats["max_tick_time"] = max(stats["max_tick_time"], tick_time)
+        stats["missed"] += len(missed)
+    engine_stats["recent_tick_times"].append(tick_time)
+    if "first_tick" not in startup:
+        mark_startup("first_tick")
+        print_startup_report()
+    for listener in tick_listeners:
+        listener(phase, clock.monotonic() - phase_start)
+
+class Session:
+    """A preset running on its own group of devices, with its own stop control, status and statistics."""
+
+    def __init__(self, name, preset, group):
+        self.name = name
+        self.preset = preset
+        self.devices = list(group)
+        self.indices = {device: i for i, device in enumerate(self.devices)}
+        self.recorder = None  # SessionRecorder writing this session's telemetry, if any
+        self.resume_at = 0.0  # Seconds into the preset to start from, when resuming a checkpoint
+        self.stop_event = threading.Event()
+        self.status = "Starting"
+        self.stats = {"ticks": 0, "tick_time": 0.0, "max_tick_time": 0.0, "missed": 0, "scheduler": {}, "tick_rate": 0.0,
+                      "time_in_band": []}
+        self.task = None
 
-def run_mindfulness_demo_cycle():
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def stopped(self):
+        return self.stop_event.is_set() or stop_event.is_set()
+
+def session_steps(session, read_stale=True):
     """
-    Mindfulness Demo Cycle:
-    - Lasts 12 seconds, divided into 4 intervals of 3 seconds.
-    - In each interval, the LED alternates between green and blue.
-    - At the start of each interval, a vibration beat is delivered.
+    The control loop of a session, shared by run_preset() and the engine: phases, tick scheduling, adaptive
+    ticks, pre-transitions, checkpoints and statistics. It leaves waiting and bus I/O to its driver by
+    yielding what it needs done, and is sent back the result:
+      ("tick", command, group, deadline) -> the devices that missed the deadline
+      ("checkpoint", elapsed)            -> None, once the checkpoint is saved
+      ("wait", wake_at)                  -> False if the session was stopped while waiting
+    read_stale reads a device whose cached reading is stale; the engine leaves that to its sampler task.
     """
-    total_duration = 12
-    interval = 3
-    num_intervals = total_duration // interval
-    for i in range(num_intervals):
-        led_color = (0, 255, 0) if i % 2 == 0 else (0, 0, 255)
-        root.after(0, lambda idx=i: status_label.config(text=f"Mindfulness Demo: Interval {idx+1}"))
-        for device in devices:
-            try:
-                device.registers.set_global_led(*led_color)
-                device.registers.set_vibration_mode(VibrationMode.MANUAL)
-                device.registers.set_vibration_intensity(1.0)
-            except Exception as e:
-                print("Error in Mindfulness Demo (beat):", e)
-        time.sleep(0.2)
-        for device in devices:
-            try:
-                device.registers.set_vibration_intensity(0.0)
-            except Exception as e:
-                print("Error turning off vibration:", e)
-        start_interval = time.time()
-        while time.time() - start_interval < (interval - 0.2):
-            if stop_event.is_set():
-                stop()
-                return
-            time.sleep(0.1)
-    stop()
+    scheduler = TickScheduler()
+    rates = TickRates()
+    timeline = PhaseTimeline(session.preset["phases"])
+    session_start = phase_start = clock.monotonic() - session.resume_at
+    next_checkpoint = clock.monotonic() + CHECKPOINT_INTERVAL
+    try:
+        for index, phase in enumerate(session.preset["phases"]):
+            if session.stopped():
+                break
+            if phase_start + phase["duration"] <= clock.monotonic():
+                phase_start += phase["duration"]  # Finished before the checkpoint being resumed
+                continue
+            if phase["status"] != session.status:
+                session.status = phase["status"]
+                set_status(session.status if len(session.devices) == len(devices) else f"{session.name}: {session.status}")
+            command = phase_command(session.preset, phase, session, timeline)
+            phase_end = phase_start + phase["duration"]
+            period = rates.period(phase)
+            first_tick = phase_start
+            if session.resume_at and clock.monotonic() - phase_start > period:
+                # Resuming mid-phase: carry on from the next tick the phase would have had
+                first_tick += math.ceil((clock.monotonic() - phase_start) / period) * period
+            scheduler.reset(first_tick, period)
+            rates.start_phase()
+            timeline.start_phase(index, phase_end)
+            while scheduler.next_deadline < phase_end and not session.stopped():
+                tick_start = time.perf_counter()  # Real time, so tick cost is measured even on a VirtualClock
+                rates.wake(timeline.tick(session.devices, read_stale))  # Moved on early: drive them now, not at their next slow tick
+                due, dt = rates.due(session.devices, phase, phase_end, timeline)
+                update_controllers(phase, due, read_stale, dt, timeline)
+                if due:  # Loop iterations with no device due aren't ticks; the scheduler's stats count those
+                    missed = yield ("tick", command, due, period)
+                    record_tick(phase, phase_start, time.perf_counter() - tick_start, missed, session)
+                if clock.monotonic() >= next_checkpoint:
+                    next_checkpoint += CHECKPOINT_INTERVAL
+                    yield ("checkpoint", clock.monotonic() - session_start)
+                wake_at = scheduler.advance(limit=phase_end)
+                if not (yield ("wait", wake_at)):
+                    break
+                scheduler.woke(wake_at)
+            phase_start = phase_end  # Phases follow each other exactly, however late the last tick ran
+    finally:
+        session.stats["scheduler"] = engine_stats["scheduler"] = scheduler.stats()
+        session.stats["tick_rate"] = engine_stats["tick_rate"] = rates.rate(len(session.devices))
+        timeline.finish_phase()
+        session.stats["time_in_band"] = engine_stats["time_in_band"] = timeline.results
+        if session.recorder is not None:
+            session.recorder.close(wait=False)  # Its thread writes the last chunk
+        clear_checkpoint(session.devices)  # Finished or stopped on purpose: only a crash leaves one to resume
 
-def run_therapendant_mindfulness_demo_cycle():
+def run_preset(preset, session=None):
     """
-    Therapendant Mindfulness Demo Cycle:
-    - Total 8.5 seconds.
-    - First 7 sec: target temperature 10°C with vibration at 26.63 Hz.
-    - Final 1.5 sec: vibration increases to 53.26 Hz.
-    - LED slowly alternates between blue and green (switching every 2 sec).
+    Runs every phase of a preset in order on all devices (or a session's), driving session_steps()
+    from this thread: bus I/O through the per-port pools and waits on the module's clock.
     """
-    start_time = time.time()
-    total_duration = 8.5
-    while time.time() - start_time < total_duration:
-        elapsed = time.time() - start_time
-        led_color = (0, 0, 255) if int(elapsed // 2) % 2 == 0 else (0, 255, 0)
-        for device in devices:
+    mark_startup("preset_started")
+    session = session or Session(preset["name"], preset, devices)
+    steps = session_steps(session)
+    try:
+        result = None
+        while True:
             try:
-                device.registers.set_led_mode(LedMode.GLOBAL_MANUAL)
-                device.registers.set_global_led(*led_color)
-                device.registers.set_thermal_mode(ThermalMode.MANUAL)
-                intensity = calculate_thermal_intensity(device, 0)
-                device.registers.set_thermal_intensity(intensity)
-                device.registers.set_vibration_mode(VibrationMode.MANUAL)
-                vib_intensity = .2 if elapsed < 7 else .9
-                device.registers.set_vibration_intensity(vib_intensity)
-            except Exception as e:
-                print("Error in Therapendant Mindfulness Demo:", e)
-        time.sleep(0.1)
-    stop()
+                step = steps.send(result)
+            except StopIteration:
+                break
+            if step[0] == "tick":
+                command, group, deadline = step[1:]
+                result = for_each_device(command, deadline, group)
+            elif step[0] == "checkpoint":
+                result = save_checkpoint(session, step[1])
+            else:
+                delay = step[1] - clock.monotonic()
+                result = not (delay > 0 and clock.wait(stop_event, delay)) and not session.stopped()
+    finally:
+        steps.close()
+    if not stop_event.is_set():
+        stop()  # Otherwise whoever set stop_event has already turned the devices off
 
-def start_carpal_tunnel_cycle():
-    """Starts the Carpal Tunnel cycle in a separate thread."""
-    global cycle_thread, stop_event
+def start_preset(preset):
+    """Starts a preset (a name from presets or a preset dict) in a separate thread."""
+    global cycle_thread
     if cycle_thread and cycle_thread.is_alive():
         return
+    if isinstance(preset, str):
+        preset = presets[preset]
     stop_event.clear()
-    cycle_thread = threading.Thread(target=run_carpal_tunnel_cycle, daemon=True)
+    cycle_thread = threading.Thread(target=run_preset, args=(preset,), daemon=True)
     cycle_thread.start()
 
-def start_carpal_tunnel_demo_cycle():
-    """Starts the Carpal Tunnel Demo cycle in a separate thread."""
-    global cycle_thread, stop_event
-    if cycle_thread and cycle_thread.is_alive():
-        return
-    stop_event.clear()
-    cycle_thread = threading.Thread(target=run_carpal_tunnel_demo_cycle, daemon=True)
-    cycle_thread.start()
+class AsyncEngine:
+    """
+    Runs sampling, preset sessions and stop handling as cooperative tasks on one asyncio event
+    loop in a dedicated thread. Each session drives its own group of devices; sessions on the
+    same port share its I/O pool in first-come order, so each gets its turn on the bus every tick.
+    Register I/O is awaited on the per-port I/O pools, and widgets are only updated through
+    call_in_ui. Runs in real time only; use run_preset() directly with a VirtualClock.
+    """
 
-def start_arthritis_cycle():
-    """Starts the Arthritis preset cycle in a separate thread."""
-    global cycle_thread, stop_event
-    if cycle_thread and cycle_thread.is_alive():
-        return
-    stop_event.clear()
-    cycle_thread = threading.Thread(target=run_arthritis_cycle, daemon=True)
-    cycle_thread.start()
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.sample_task = None
+        self.sessions = {}  # name -> Session
+        self.started = 0
+        self.lock = threading.Lock()
 
-def start_theraband_arthritis_cycle():
-    """Starts the TheraBand Arthritis Preset cycle in a separate thread."""
-    global cycle_thread, stop_event
-    if cycle_thread and cycle_thread.is_alive():
-        return
-    stop_event.clear()
-    cycle_thread = threading.Thread(target=run_theraband_arthritis_cycle, daemon=True)
-    cycle_thread.start()
+    def start(self):
+        """Starts the event loop thread and the sampling task."""
+        if self.thread and self.thread.is_alive():
+            return
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="engine")
+        self.thread.start()
+        self.sample_task = self.submit(self.sample_forever())
 
-def start_mindfulness_demo_cycle():
-    """Starts the Mindfulness Demo cycle in a separate thread."""
-    global cycle_thread, stop_event
-    if cycle_thread and cycle_thread.is_alive():
-        return
-    stop_event.clear()
-    cycle_thread = threading.Thread(target=run_mindfulness_demo_cycle, daemon=True)
-    cycle_thread.start()
+    def submit(self, coro):
+        """Schedules a coroutine on the engine loop from any thread; returns a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
 
-def start_therapendant_mindfulness_demo_cycle():
-    """Starts the Therapendant Mindfulness Demo cycle in a separate thread."""
-    global cycle_thread, stop_event
-    if cycle_thread and cycle_thread.is_alive():
-        return
-    stop_event.clear()
-    cycle_thread = threading.Thread(target=run_therapendant_mindfulness_demo_cycle, daemon=True)
-    cycle_thread.start()
+    def busy(self, group=None):
+        """True if a session is running on any device of group, or on any device at all by default."""
+        group = None if group is None else set(group)
+        return any(session.running() and (group is None or group & set(session.devices))
+                   for session in self.sessions.values())
 
-def stop():
-    """Stops the active process and resets devices."""
-    stop_event.set()
-    for device in devices:
+    async def io(self, io, device, command):
+        """Awaits command(device) on the device's port pool; returns False if the device was busy."""
+        future = io.submit(device, command)
+        if future is None:
+            return False
+        await asyncio.wrap_future(future)
+        return True
+
+    async def sample_forever(self):
+        """Reads every device's skin temperature into the sampler cache every sampler.period."""
+        next_read = clock.monotonic()
+        while True:
+            reads = [asyncio.ensure_future(self.io(sampler.io, device, sampler.read)) for device in devices]
+            if reads:
+                await asyncio.wait(reads, timeout=sampler.period)
+            next_read += sampler.period
+            await asyncio.sleep(max(0.0, next_read - clock.monotonic()))
+
+    async def tick(self, command, group, deadline):
+        """Runs command on every device of group concurrently; returns the devices that missed the deadline."""
+        ticks = {asyncio.ensure_future(self.io(device_io, device, command)): device for device in group}
+        if not ticks:
+            return []
+        done, not_done = await asyncio.wait(ticks, timeout=deadline)
+        missed = [ticks[task] for task in not_done]
+        for task in done:
+            if task.cancelled():
+                device_io.dropped += 1  # Dropped by stop(), not an error
+            elif task.exception() is not None:
+                print(f"Error on device {ticks[task]}:", task.exception())
+            elif not task.result():
+                missed.append(ticks[task])
+        if missed:
+            print(f"{len(missed)} device(s) missed the {deadline}s tick deadline:", missed)
+        return missed
+
+    async def run_session(self, session):
+        """Drives session_steps() on the event loop: ticks are awaited on the I/O pools, waits are asyncio sleeps."""
+        loop = asyncio.get_running_loop()
+        steps = session_steps(session, read_stale=False)  # The sampler task keeps readings fresh
         try:
-            device.registers.set_thermal_mode(ThermalMode.OFF)
-            device.registers.set_vibration_mode(VibrationMode.OFF)
-            device.registers.set_thermal_intensity(0.0)
-            device.registers.set_vibration_intensity(0.0)
-            device.registers.set_global_led(0, 0, 0)  # Reset LED to off
+            result = None
+            while True:
+                try:
+                    step = steps.send(result)
+                except StopIteration:
+                    break
+                if step[0] == "tick":
+                    command, group, deadline = step[1:]
+                    result = await self.tick(command, group, deadline)
+                elif step[0] == "checkpoint":
+                    result = await loop.run_in_executor(None, save_checkpoint, session, step[1])
+                else:
+                    await asyncio.sleep(max(0.0, step[1] - clock.monotonic()))
+                    result = not session.stopped()
+        finally:
+            steps.close()
+        if not session.stopped():
+            session.stop_event.set()
+            await loop.run_in_executor(None, stop, session.devices)
+
+    def start_session(self, preset, group=None, name=None, resume=False):
+        """
+        Starts a preset (a name from presets or a preset dict) on a group of devices, all of them by default.
+        If the same preset was cut short on the same devices within RESUME_WINDOW, it carries on from its last
+        checkpoint with the controllers' state restored if resume is set. Otherwise it starts from the beginning,
+        saying so if there was a run it could have resumed.
+        Returns the new Session, or None if any of those devices is already in a running session.
+        """
+        group = list(devices if group is None else group)
+        if isinstance(preset, str):
+            preset = presets[preset]
+        with self.lock:
+            if not group or self.busy(group):
+                return None
+            for finished in [key for key, session in self.sessions.items() if not session.running()]:
+                del self.sessions[finished]
+            self.started += 1
+            mark_startup("preset_started")
+            session = Session(name or f"{preset['name']} #{self.started}", preset, group)
+            checkpoint = load_checkpoint(preset, group)
+            if checkpoint is not None and not resume:
+                print(f"Not resuming {checkpoint['name']}, interrupted {describe_checkpoint(checkpoint)}: starting from the beginning")
+                checkpoint = None
+            if checkpoint is not None:
+                session.resume_at = checkpoint["elapsed"]
+                for device in group:
+                    if identity_of(device) in checkpoint["controllers"]:
+                        controllers.restore(device, checkpoint["controllers"][identity_of(device)])
+                print(f"Resuming {session.name} {session.resume_at:.0f} s in, from {checkpoint['name']}")
+            session.recorder = open_recorder(session)
+            self.sessions[session.name] = session
+            stop_event.clear()
+            session.task = self.submit(self.run_session(session))
+        return session
+
+    def stop_devices(self, group):
+        """Stops every session using any device of group and turns the whole group off."""
+        group = list(group)
+        for session in list(self.sessions.values()):
+            if session.running() and set(session.devices) & set(group):
+                session.stop_event.set()
+                session.task.cancel()
+                group.extend(device for device in session.devices if device not in group)
+        self.submit(self._stop(group))
+
+    def request_stop(self):
+        """
+        Stops everything from any thread without blocking it: cancels every session, then turns every device off.
+        Returns a future of the seconds stop() took.
+        """
+        stop_event.set()
+        for session in list(self.sessions.values()):
+            session.stop_event.set()
+            if session.task is not None:
+                session.task.cancel()
+        return self.submit(self._stop())
+
+    async def _stop(self, group=None):
+        return await asyncio.get_running_loop().run_in_executor(None, stop, group)
+
+    async def _shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    def shutdown(self):
+        """Cancels every task, waits for them to finish and stops the event loop thread, then closes the session files."""
+        if self.loop is None or not self.loop.is_running():
+            return
+        self.submit(self._shutdown())
+        self.thread.join(timeout=1.0)
+        for session in self.sessions.values():
+            if session.recorder is not None:
+                session.recorder.close()
+
+engine = AsyncEngine()
+
+STOP_DEADLINE = 0.5  # Seconds within which every device must have received the off command
+STOP_WORKERS = 32    # Threads reserved for the off broadcast, so it never queues behind tick commands
+
+stop_pool = ThreadPoolExecutor(max_workers=STOP_WORKERS, thread_name_prefix="stop")
+stop_lock = threading.Lock()
+
+def stop(group=None):
+    """
+    Stops the active process and turns every device off in parallel: queued tick commands and sensor reads
+    are dropped, and on each port the off commands take the bus ahead of anything still waiting for it.
+    Given a group, only those devices are turned off and other sessions carry on.
+    Returns the seconds it took until every device was off.
+    """
+    started = time.perf_counter()
+    if group is None:
+        stop_event.set()
+        group = devices
+    device_io.cancel_pending(group)
+    sampler.io.cancel_pending(group)
+    def command(device):
+        try:
+            registers = registers_for(device)
+            with registers.lock:
+                registers.invalidate()  # Always send the off commands, whatever the cache says
+                registers.apply_state(OFF_FRAME, urgent=True)
         except Exception as e:
             print(f"Error during stop: {e}")
-    print("Cycle stopped.")
+    with stop_lock:
+        futures = {stop_pool.submit(command, device): device for device in group}
+        done, not_done = wait(futures, timeout=STOP_DEADLINE)
+    elapsed = time.perf_counter() - started
+    if not_done:
+        print(f"Stop: {len(not_done)} device(s) not confirmed off within {STOP_DEADLINE}s:", [futures[f] for f in not_done])
+    hits, misses, transactions = shadow_stats()
+    print(f"Cycle stopped in {elapsed * 1000:.0f} ms. Register writes sent: {misses} in {transactions} transactions, skipped: {hits}")
+    for name, report in port_report().items():
+        print(f"  Port {name}: {report['devices']} device(s), {report['transactions']} transactions, {report['utilization']:.0%} busy")
+    return elapsed
+
+DEVICE_COUNT = int(os.environ.get("DOTCODE_DEVICES", 4))  # How many Dots discovery looks for, over every port
+DISCOVERY_CACHE = os.environ.get("DOTCODE_DISCOVERY_CACHE", os.path.join(os.path.expanduser("~"), ".dotcode_devices.json"))
+
+def identity_of(device):
+    """
+    Returns what tells one Dot from another across restarts: its serial number, or else its port and address.
+    A device with neither only has an identity for as long as the object lives.
+    """
+    serial = getattr(device, "serial", None)
+    if serial:
+        return str(serial)
+    address = getattr(device, "address", None)
+    return f"{port_of(device)}:{address}" if address is not None else repr(device)
+
+def discovery_backend():
+    """
+    Returns (scan(count), list_ports(), probe(port, address, timeout)) for the attached hardware. probe finds
+    one Dot at a known port and address, or returns None; list_ports and probe are None when the backend
+    can only do its own full scan.
+    """
+    simulated = os.environ.get("DOTCODE_SIMULATE")
+    if simulated:
+        import DotCode_Sim
+        hardware = DotCode_Sim.SimulatedHardware(int(simulated), int(os.environ.get("DOTCODE_SIMULATE_PORTS", 1)))
+        return (lambda count: hardware.discover()), hardware.list_ports, hardware.probe
+    return discover_devices, None, None
+
+MAX_ADDRESS = 16        # Highest address a scan tries on each port
+PROBE_TIMEOUT = 0.01    # Seconds a scan waits on an empty address
+
+def stream_devices(count, scan, list_ports, probe):
+    """
+    Yields Dots as they are found. Every port is scanned at once, each on its own thread, probing
+    every address up to MAX_ADDRESS back to back with a short timeout; the scan ends early once
+    count Dots have answered. Backends without list_ports and probe fall back to their own scan.
+    """
+    if list_ports is None or probe is None:
+        yield from scan(count)
+        return
+    found = queue.Queue()
+    enough = threading.Event()  # Set once count Dots have been found, so the other ports stop probing
+    def scan_port(port):
+        try:
+            for address in range(1, MAX_ADDRESS + 1):
+                if enough.is_set():
+                    break
+                try:
+                    device = probe(port, address, PROBE_TIMEOUT)
+                except Exception as e:
+                    print(f"Probe of {port}:{address} failed: {e}")
+                    device = None
+                if device is not None:
+                    found.put(device)
+        finally:
+            found.put(None)  # This port is done
+    port_names = list_ports()
+    with ThreadPoolExecutor(max_workers=max(1, len(port_names)), thread_name_prefix="scan") as pool:
+        for port in port_names:
+            pool.submit(scan_port, port)
+        remaining = len(port_names)
+        yielded = 0
+        while remaining:
+            device = found.get()
+            if device is None:
+                remaining -= 1
+            elif yielded < count:
+                yielded += 1
+                if yielded == count:
+                    enough.set()
+                yield device
+
+def load_discovery_cache(path=DISCOVERY_CACHE):
+    """Returns the cached [{"port", "address", "identity"}] of the last scan, or [] if there isn't a usable one."""
+    try:
+        with open(path) as f:
+            return json.load(f)["devices"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+def save_discovery_cache(found, path=DISCOVERY_CACHE):
+    entries = [{"port": port_of(device), "address": getattr(device, "address", None), "identity": identity_of(device)}
+               for device in found]
+    try:
+        with open(path, "w") as f:
+            json.dump({"saved": time.strftime("%Y-%m-%dT%H:%M:%S"), "devices": entries}, f, indent=2)
+    except OSError as e:
+        print(f"Could not save the discovery cache: {e}")
+
+def cached_devices(probe, path=DISCOVERY_CACHE):
+    """
+    Probes each Dot in the discovery cache at its port and address. Returns them if every one still
+    answers with the same identity, or None if the cache is missing or out of date. A rig with fewer
+    Dots than DOTCODE_DEVICES is trusted as it was cached: a scan wouldn't find the ones it doesn't have.
+    """
+    entries = load_discovery_cache(path)
+    if probe is None or not entries:
+        return None
+    found = []
+    for entry in entries:
+        try:
+            device = probe(entry["port"], entry["address"], PROBE_TIMEOUT)
+        except Exception as e:
+            print(f"Probe of {entry['port']}:{entry['address']} failed: {e}")
+            return None
+        if device is None or identity_of(device) != entry["identity"]:
+            return None
+        found.append(device)
+    return found
+
+def connect_devices(count=DEVICE_COUNT, path=DISCOVERY_CACHE, on_found=None):
+    """
+    Finds the Dots to drive on every attached port or hub and assigns each to its port. The Dots found
+    last time are probed first; only if one of them has moved or gone does it fall back to a full scan,
+    which calls on_found(device) for each Dot as soon as it answers. Backends that can't probe a single
+    address always scan, and keep no cache.
+    Setting DOTCODE_SIMULATE=<n> swaps in n simulated Dots instead, spread over DOTCODE_SIMULATE_PORTS ports.
+    """
+    mark_startup("discovery_started")
+    started = time.perf_counter()
+    scan, list_ports, probe = discovery_backend()
+    found = cached_devices(probe, path)
+    if found is None:
+        found = []
+        for device in stream_devices(count, scan, list_ports, probe):
+            found.append(device)
+            if on_found is not None:
+                on_found(device)
+        found.sort(key=lambda device: (port_of(device), getattr(device, "address", 0)))  # Stable dot numbers
+        if probe is not None:
+            save_discovery_cache(found, path)  # Only a backend that can probe one address can check it next time
+        print(f"Scanned for devices in {time.perf_counter() - started:.2f} s")
+    else:
+        print(f"Found {len(found)} cached device(s) in {time.perf_counter() - started:.2f} s")
+    mark_startup("discovered")
+    for name, attached in assign_ports(found).items():
+        print(f"Port {name}: {len(attached)} device(s)")
+    return found
+
+def connect(count=DEVICE_COUNT, on_found=None):
+    """Finds the devices, sets up their ports and registers and starts the engine, ready for a preset."""
+    global devices
+    load_tuning()
+    found = connect_devices(count, on_found=on_found)
+    for device in found:
+        registers_for(device)
+    engine.start()
+    devices = found
+    mark_startup("connected")
+    return devices
+
+def connect_in_background(count=DEVICE_COUNT):
+    """Connects on a worker thread so the window is usable during a scan; each Dot is listed as soon as it answers."""
+    found = []
+    def on_found(device):
+        found.append(identity_of(device))
+        update_widget("devices_label", text=f"Scanning: {len(found)} dot(s) found ({', '.join(found)})")
+    def run():
+        try:
+            connect(count, on_found)
+            update_widget("devices_label", text=f"Dots: {len(devices)} connected")
+            set_status("Status: Idle" if devices else "No dots found.")
+        except Exception as e:
+            print(f"Discovery failed: {e}")
+            update_widget("devices_label", text="Dots: discovery failed")
+    threading.Thread(target=run, daemon=True, name="discovery").start()
 
 def on_close():
     stop()
+    engine.shutdown()
+    print(ui_report())
     root.destroy()
 
 def initialize_ui():
-    """Creates the UI and initializes all widgets with a cream white background."""
-    global root, status_label, skin_temp_label, preset_entry, preset_combobox
-    global high_temp_entry, low_temp_entry, heat_duration_entry, cold_duration_entry, cycle_entry, vib_combobox
+    """Creates the UI and initializes all widgets with a cream white background, then connects to the dots."""
+    global root, status_label, devices_label, skin_temp_label, preset_entry, preset_combobox
+    global high_temp_entry, low_temp_entry, heat_duration_entry, cold_duration_entry, cycle_entry, dots_entry, vib_combobox
+    import tkinter as tk
+    from tkinter import ttk
 
     root = tk.Tk()
     root.title("Thermal Device Controller")
@@ -456,15 +1788,20 @@ def initialize_ui():
     status_label = tk.Label(root, text="Status: Idle", fg="black", bg=cream_bg, font=("Arial", 12))
     status_label.pack(pady=5)
 
+    devices_label = tk.Label(root, text="Dots: looking for devices...", fg="black", bg=cream_bg)
+    devices_label.pack(pady=5)
+
     skin_temp_label = tk.Label(root, text="Skin Temperature: -- °C", fg="black", bg=cream_bg)
     skin_temp_label.pack(pady=5)
     get_skin_temperature()
+    pump_ui()
 
     for label_text, var_name in [("Set High Temperature (°C):", "high_temp_entry"),
                                  ("Set Low Temperature (°C):", "low_temp_entry"),
                                  ("Heat Duration (seconds):", "heat_duration_entry"),
                                  ("Cold Duration (seconds):", "cold_duration_entry"),
-                                 ("Number of Cycles:", "cycle_entry")]:
+                                 ("Number of Cycles:", "cycle_entry"),
+                                 ("Dots (blank for all, e.g. 1-2 or 1,3):", "dots_entry")]:
         tk.Label(root, text=label_text, fg="black", bg=cream_bg).pack()
         globals()[var_name] = tk.Entry(root, bg="white", fg="black")
         globals()[var_name].pack()
@@ -474,15 +1811,209 @@ def initialize_ui():
     vib_combobox.current(0)
 
     tk.Button(root, text="Apply Settings", command=apply_settings, bg=cream_bg, fg="black").pack(pady=5)
-    tk.Button(root, text="Stop", command=stop, bg=cream_bg, fg="black").pack(pady=5)
-    tk.Button(root, text="TheraBand Carpal Tunnel Preset", command=start_carpal_tunnel_cycle, bg=cream_bg, fg="black").pack(pady=5)
-    tk.Button(root, text="TheraBand Carpal Tunnel Demo", command=start_carpal_tunnel_demo_cycle, bg=cream_bg, fg="black").pack(pady=5)
-    tk.Button(root, text="TheraBand Arthritis Demo", command=start_arthritis_cycle, bg=cream_bg, fg="black").pack(pady=5)
-    tk.Button(root, text="TheraBand Mindfulness Demo", command=start_mindfulness_demo_cycle, bg=cream_bg, fg="black").pack(pady=5)
-    tk.Button(root, text="TheraPendant Mindfulness Demo", command=start_therapendant_mindfulness_demo_cycle, bg=cream_bg, fg="black").pack(pady=5)
+    tk.Button(root, text="Stop", command=stop_selected, bg=cream_bg, fg="black").pack(pady=5)
+    tk.Button(root, text="TheraBand Carpal Tunnel Preset", command=lambda: start_selected("carpal_tunnel"), bg=cream_bg, fg="black").pack(pady=5)
+    tk.Button(root, text="TheraBand Carpal Tunnel Demo", command=lambda: start_selected("carpal_tunnel_demo"), bg=cream_bg, fg="black").pack(pady=5)
+    tk.Button(root, text="TheraBand Arthritis Demo", command=lambda: start_selected("arthritis"), bg=cream_bg, fg="black").pack(pady=5)
+    tk.Button(root, text="TheraBand Mindfulness Demo", command=lambda: start_selected("mindfulness_demo"), bg=cream_bg, fg="black").pack(pady=5)
+    tk.Button(root, text="TheraPendant Mindfulness Demo", command=lambda: start_selected("therapendant_mindfulness_demo"), bg=cream_bg, fg="black").pack(pady=5)
 
     root.protocol("WM_DELETE_WINDOW", on_close)
+    mark_startup("window")
+    print_startup_report()
+    connect_in_background()
     root.mainloop()
 
-devices = discover_devices(4)
-initialize_ui()
\ No newline at end of file
+def run_headless(name, dots="all", resume=False):
+    """
+    Runs one preset on the given dots without any window and waits for it to finish, reporting status on stdout.
+    SIGINT or SIGTERM turns every device off and ends the run early. Returns True if the preset ran to the end.
+    """
+    connect()
+    try:
+        group = parse_dots(dots)
+    except ValueError as e:
+        print(f"Invalid dots {dots!r}: {e}")
+        return False
+    interrupted = threading.Event()
+    def handle_signal(signum, frame):
+        print(f"Received {signal.Signals(signum).name}, stopping")
+        interrupted.set()
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    session = engine.start_session(name, group, resume=resume)
+    if session is None:
+        print("No devices to run on.")
+        engine.shutdown()
+        return False
+    while session.running() and not interrupted.is_set():
+        interrupted.wait(0.5)
+    if interrupted.is_set():
+        stop()
+    else:
+        session.task.result()
+    engine.shutdown()
+    print(f"{session.name}: {'stopped' if interrupted.is_set() else 'finished'} after {session.stats['ticks']} ticks, "
+          f"{session.stats['tick_rate']:.2f} ticks/s per device")
+    return not interrupted.is_set()
+
+SERVE_HOST = "127.0.0.1"  # Only clients on this machine can drive the dots
+SERVE_PORT = 8765
+
+class Daemon:
+    """
+    Keeps the dots connected and the engine running between presets, and takes commands on a TCP port,
+    one per line, each answered with one line of JSON:
+      run <preset> [dots] [resume] queues a preset; it starts as soon as none of its dots is busy, from the
+                                   beginning unless "resume" asks to carry on a recent interrupted run
+      stop [dots]                  stops the sessions on those dots (all by default) and drops their queued runs
+      status                       lists the running sessions and the queued runs
+      list                         lists the presets
+      shutdown                     turns every dot off and exits
+    """
+
+    def __init__(self):
+        self.queue = []  # (preset name, group, resume) waiting for their dots, oldest first
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def command(self, line):
+        """Carries out one command line and returns its reply."""
+        words = line.split()
+        if not words:
+            return {"ok": False, "error": "empty command"}
+        name, args = words[0].lower(), words[1:]
+        try:
+            if name == "run":
+                if not args or args[0] not in presets:
+                    return {"ok": False, "error": f"run needs one of {', '.join(sorted(presets))}"}
+                dots = [arg for arg in args[1:] if arg != "resume"]
+                group = parse_dots(dots[0] if dots else "all")
+                with self.lock:
+                    self.queue.append((args[0], group, "resume" in args[1:]))
+                self.dispatch()
+                return dict(self.status(), ok=True)
+            if name == "stop":
+                group = parse_dots(args[0] if args else "all")
+                with self.lock:
+                    self.queue = [entry for entry in self.queue if not set(entry[1]) & set(group)]
+                if len(group) == len(devices):
+                    engine.request_stop()
+                else:
+                    engine.stop_devices(group)
+                return {"ok": True}
+            if name == "status":
+                return dict(self.status(), ok=True)
+            if name == "list":
+                return {"ok": True, "presets": {key: preset["name"] for key, preset in presets.items()}}
+            if name == "shutdown":
+                self.done.set()
+                return {"ok": True}
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": False, "error": f"unknown command {name!r}"}
+
+    def dispatch(self):
+        """Starts every queued run whose dots are free, in order: a run never overtakes an earlier one on the same dots."""
+        with self.lock:
+            claimed = set()
+            for entry in list(self.queue):
+                name, group, resume = entry
+                if not claimed & set(group) and not engine.busy(group):
+                    self.queue.remove(entry)
+                    engine.start_session(name, group, resume=resume)
+                claimed.update(group)
+
+    def status(self):
+        def numbers(group):
+            return [devices.index(device) + 1 for device in group]
+        with self.lock:
+            queued = [{"preset": name, "dots": numbers(group)} for name, group, resume in self.queue]
+        sessions = [{"name": session.name, "status": session.status, "dots": numbers(session.devices),
+                     "running": session.running(), "ticks": session.stats["ticks"]}
+                    for session in list(engine.sessions.values())]
+        return {"sessions": sessions, "queued": queued}
+
+    def serve(self, host=SERVE_HOST, port=SERVE_PORT):
+        """Takes commands until "shutdown", SIGINT or SIGTERM, starting queued runs as dots free up."""
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    reply = daemon.command(line.decode(errors="replace"))
+                    self.wfile.write((json.dumps(reply) + "\n").encode())
+                    if daemon.done.is_set():
+                        break
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="serve").start()
+        def handle_signal(signum, frame):
+            print(f"Received {signal.Signals(signum).name}, shutting down")
+            self.done.set()
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+        print(f"Listening for commands on {host}:{port}")
+        while not self.done.wait(0.5):
+            self.dispatch()
+        server.shutdown()
+        server.server_close()
+        stop()
+        engine.shutdown()
+
+def main(argv=None):
+    """
+    Starts the window with no arguments; "run <preset>" runs a preset headless, "serve" keeps the dots
+    connected and takes commands as a daemon, "tune" autotunes the dots' controllers and "list" prints the presets.
+    """
+    parser = argparse.ArgumentParser(description="Drive Datafeel Dots through thermal, vibration and LED presets.")
+    commands = parser.add_subparsers(dest="command")
+    run = commands.add_parser("run", help="run a preset without a window and exit when it finishes")
+    run.add_argument("preset", choices=sorted(presets), help="preset to run")
+    run.add_argument("--devices", default="all", help='dots to run on, e.g. "all", "1-2" or "1,3" (default: all)')
+    run.add_argument("--log", help="append status messages to this file instead of stdout")
+    run.add_argument("--resume", action="store_true", help="carry on a recent interrupted run of the preset on these dots "
+                                                           "instead of starting from the beginning")
+    serve = commands.add_parser("serve", help="keep the dots connected and run presets on request until shut down")
+    serve.add_argument("--host", default=SERVE_HOST, help="address to listen on (default: %(default)s)")
+    serve.add_argument("--port", type=int, default=SERVE_PORT, help="TCP port to listen on (default: %(default)s)")
+    serve.add_argument("--log", help="append status messages to this file instead of stdout")
+    tune = commands.add_parser("tune", help="run a step experiment on each dot and save PI gains fitted to it")
+    tune.add_argument("--devices", default="all", help='dots to tune (default: all)')
+    tune.add_argument("--seconds", type=float, default=AUTOTUNE_SECONDS, help="length of the step (default: %(default)s)")
+    tune.add_argument("--step", type=float, default=AUTOTUNE_STEP, help="thermal intensity of the step (default: %(default)s)")
+    commands.add_parser("list", help="list the presets")
+    commands.add_parser("gui", help="open the window (the default)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for key, preset in presets.items():
+            print(f"{key}: {preset['name']}, {sum(phase['duration'] for phase in preset['phases'])} s")
+    elif args.command == "tune":
+        connect()
+        try:
+            group = parse_dots(args.devices)
+        except ValueError as e:
+            sys.exit(f"Invalid dots {args.devices!r}: {e}")
+        tuned = autotune(group, args.step, args.seconds)
+        engine.shutdown()
+        sys.exit(0 if tuned else 1)
+    elif args.command == "run":
+        if args.log:
+            sys.stdout = open(args.log, "a", buffering=1)
+        sys.exit(0 if run_headless(args.preset, args.devices, args.resume) else 1)
+    elif args.command == "serve":
+        if args.log:
+            sys.stdout = open(args.log, "a", buffering=1)
+        connect()
+        Daemon().serve(args.host, args.port)
+    else:
+        initialize_ui()
+
+mark_startup("imported")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
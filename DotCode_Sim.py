@@ -0,0 +1,208 @@
+import math
+import random
+import threading
+import time
+from datafeel.device import ThermalMode, LedMode, VibrationMode
+
+# Thermal plant of a simulated Dot resting on skin
+AMBIENT_TEMP = 32.0      # Skin temperature (°C) the Dot settles to with the thermal element off
+THERMAL_GAIN = 14.0      # Degrees above or below ambient reached at full thermal intensity
+TIME_CONSTANT = 25.0     # Seconds for the skin temperature to cover 63% of a step
+SENSOR_NOISE = 0.05      # Standard deviation (°C) of the skin temperature sensor
+PLANT_SPREAD = 0.0       # Fraction by which each Dot's gain and time constant may differ from the above
+
+class SimulatedBusError(IOError):
+    """Raised when a simulated transaction fails, like a Modbus timeout on a real bus."""
+
+class SimulatedBus:
+    """
+    A half-duplex serial bus shared by the Dots on one port: one transaction at a time,
+    each taking latency seconds and failing with probability failure_rate.
+    """
+
+    def __init__(self, port, latency=0.0, failure_rate=0.0, sleep=time.sleep, rng=None):
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        self.transactions = 0
+        self.failures = 0
+        self.busy_time = 0.0
+
+    def transaction(self):
+        with self.lock:
+            self.transactions += 1
+            if self.latency:
+                self.sleep(self.latency)
+                self.busy_time += self.latency
+            if self.failure_rate and self.rng.random() < self.failure_rate:
+                self.failures += 1
+                raise SimulatedBusError(f"No response on {self.port}")
+
+class SimulatedRegisters:
+    """Implements the datafeel registers API used by DotCode on top of a first-order thermal model."""
+
+    def __init__(self, bus, clock=time, rng=None, record=False, spread=PLANT_SPREAD):
+        self.bus = bus
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.gain = THERMAL_GAIN
+        self.time_constant = TIME_CONSTANT
+        if spread:
+            self.gain *= 1 + self.rng.uniform(-spread, spread)
+            self.time_constant *= 1 + self.rng.uniform(-spread, spread)
+        self.thermal_mode = ThermalMode.OFF
+        self.thermal_intensity = 0.0
+        self.vibration_mode = VibrationMode.OFF
+        self.vibration_intensity = 0.0
+        self.led_mode = LedMode.GLOBAL_MANUAL
+        self.global_led = (0, 0, 0)
+        self.temperature = AMBIENT_TEMP
+        self.updated = clock.monotonic()
+        self.history = [] if record else None  # (time, fields) of every write when recording
+
+    def _advance(self):
+        """Moves the thermal plant forward to the current time."""
+        now = self.clock.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if elapsed <= 0:
+            return
+        drive = self.thermal_intensity if self.thermal_mode == ThermalMode.MANUAL else 0.0
+        settle_temp = AMBIENT_TEMP + self.gain * drive
+        self.temperature = settle_temp + (self.temperature - settle_temp) * math.exp(-elapsed / self.time_constant)
+
+    def _set(self, **fields):
+        self.bus.transaction()
+        self._advance()
+        for name, value in fields.items():
+            setattr(self, name, value)
+        if self.history is not None:
+            self.history.append((round(self.updated, 6), fields))
+
+    def set_thermal_mode(self, mode):
+        self._set(thermal_mode=mode)
+
+    def set_thermal_intensity(self, intensity):
+        self._set(thermal_intensity=max(-1.0, min(1.0, intensity)))
+
+    def set_vibration_mode(self, mode):
+        self._set(vibration_mode=mode)
+
+    def set_vibration_intensity(self, intensity):
+        self._set(vibration_intensity=intensity)
+
+    def set_led_mode(self, mode):
+        self._set(led_mode=mode)
+
+    def set_global_led(self, r, g, b):
+        self._set(global_led=(r, g, b))
+
+    def write_frame(self, fields):
+        """Writes a whole command frame in one multi-register transaction."""
+        fields = dict(fields)
+        if "thermal_intensity" in fields:
+            fields["thermal_intensity"] = max(-1.0, min(1.0, fields["thermal_intensity"]))
+        self._set(**fields)
+
+    def get_skin_temperature(self):
+        self.bus.transaction()
+        self._advance()
+        return self.temperature + self.rng.gauss(0.0, SENSOR_NOISE)
+
+    def is_off(self):
+        """True once the Dot has been sent the thermal, vibration and LED off commands."""
+        return (self.thermal_mode == ThermalMode.OFF and self.vibration_mode == VibrationMode.OFF
+                and self.global_led == (0, 0, 0))
+
+class SimulatedDot:
+    """A virtual Dot at an address on a simulated bus, with the same .registers attribute as a real one."""
+
+    def __init__(self, bus, address, clock=time, rng=None, record=False, spread=PLANT_SPREAD):
+        self.bus = bus
+        self.port = bus.port
+        self.address = address
+        self.serial = f"SIM-{bus.port}-{address}"
+        self.registers = SimulatedRegisters(bus, clock, rng, record, spread)
+
+    def __repr__(self):
+        return f"SimulatedDot({self.port}, {self.address})"
+
+MAX_ADDRESS = 16       # Highest Modbus address a scan tries on each port
+PROBE_TIMEOUT = 0.02   # Seconds a scan waits on an address before deciding nothing is there
+
+class SimulatedHardware:
+    """
+    Dots attached to simulated ports, found either by a full scan of every address or by probing
+    one known port and address. Each address that doesn't answer costs probe_timeout seconds.
+    """
+
+    def __init__(self, count, ports=1, latency=0.0, failure_rate=0.0, clock=time, sleep=time.sleep,
+                 seed=None, record=False, probe_timeout=PROBE_TIMEOUT, spread=PLANT_SPREAD):
+        rng = random.Random(seed)
+        self.sleep = sleep
+        self.probe_timeout = probe_timeout
+        self.buses = {f"SIM{i}": SimulatedBus(f"SIM{i}", latency, failure_rate, sleep, random.Random(rng.random()))
+                      for i in range(ports)}
+        self.dots = {}  # (port, address) -> SimulatedDot
+        names = list(self.buses)
+        for i in range(count):
+            bus = self.buses[names[i % ports]]
+            dot = SimulatedDot(bus, i // ports + 1, clock, random.Random(rng.random()), record, spread)
+            self.dots[(dot.port, dot.address)] = dot
+
+    def list_ports(self):
+        return list(self.buses)
+
+    def probe(self, port, address, timeout=None):
+        """Asks one address on one port for its Dot; returns it, or None after timeout (default probe_timeout)."""
+        if port not in self.buses:
+            return None  # The port itself is gone
+        dot = self.dots.get((port, address))
+        if dot is None:
+            timeout = self.probe_timeout if timeout is None else timeout
+            if timeout:
+                with self.buses[port].lock:  # Nothing else can use the bus while it waits for an answer
+                    self.sleep(timeout)
+            return None
+        dot.bus.transaction()
+        return dot
+
+    def discover(self):
+        """Scans every address on every port and returns the Dots that answered, port by port."""
+        found = []
+        for port in self.buses:
+            for address in range(1, MAX_ADDRESS + 1):
+                dot = self.probe(port, address)
+                if dot is not None:
+                    found.append(dot)
+        return found
+
+def discover_devices(count, ports=1, latency=0.0, failure_rate=0.0, clock=time, sleep=time.sleep, seed=None, record=False,
+                     spread=PLANT_SPREAD):
+    """
+    Creates count simulated Dots spread evenly over the given number of ports.
+    latency is the time each transaction holds its bus; seed makes noise and failures repeatable;
+    record keeps every write in each Dot's registers.history; spread varies each Dot's thermal plant.
+    """
+    hardware = SimulatedHardware(count, ports, latency, failure_rate, clock, sleep, seed, record, spread=spread)
+    return list(hardware.dots.values())
+
+def run_catalogue(names=None, count=4, seed=0):
+    """
+    Runs presets (all of them by default) on simulated Dots against a VirtualClock, so a whole
+    catalogue takes seconds instead of an afternoon. Returns {name: (engine stats, Dots)}.
+    """
+    import DotCode_Final as app
+    results = {}
+    for name in names or list(app.presets):
+        app.use_clock(app.VirtualClock())
+        app.devices = discover_devices(count, clock=app.clock, seed=seed, record=True)
+        app.reset_session()
+        app.stop_event.clear()
+        app.run_preset(app.presets[name])
+        results[name] = (dict(app.engine_stats, recent_tick_times=list(app.engine_stats["recent_tick_times"])), app.devices)
+    app.use_clock(app.SystemClock())
+    return results
@@ -0,0 +1,253 @@
+import os
+import mmap
+import json
+import math
+import time
+import queue
+import bisect
+import struct
+import threading
+from array import array
+
+TELEMETRY_CAPACITY = 36000  # Samples kept per device: an hour at 10 ticks a second, ten hours at one
+
+# Recorded on every tick, in this order. led is the RGB colour packed as 0xRRGGBB; missing values are NaN.
+FIELDS = ("timestamp", "skin_temp", "target", "error", "integral", "thermal", "vibration", "led")
+
+def pack_led(led):
+    """Packs an (r, g, b) tuple into one number, or NaN when the LED isn't being driven."""
+    if led is None:
+        return math.nan
+    r, g, b = led
+    return float((r << 16) | (g << 8) | b)
+
+def unpack_led(value):
+    if math.isnan(value):
+        return None
+    value = int(value)
+    return (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+
+class TelemetryRing:
+    """
+    A fixed-size ring of per-tick samples for one device, one preallocated array per field.
+    Every sample is written twice, at i and i + capacity, so the last n samples are always
+    contiguous and window() can hand out memoryviews without copying. Appending is O(1)
+    and allocates nothing; once full, the oldest samples are overwritten.
+    """
+
+    def __init__(self, capacity=TELEMETRY_CAPACITY):
+        self.capacity = capacity
+        # Timestamps need double precision; the rest are sensor and command values
+        self.columns = {name: array("d" if name == "timestamp" else "f", bytes(8 if name == "timestamp" else 4) * (2 * capacity))
+                        for name in FIELDS}
+        self.next = 0   # Slot the next sample goes in
+        self.count = 0  # Samples held, up to capacity
+        self.total = 0  # Samples ever appended
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, skin_temp, target, error, integral, thermal, vibration, led):
+        values = (timestamp, skin_temp, target, error, integral, thermal, vibration, led)
+        with self.lock:
+            i = self.next
+            for name, value in zip(FIELDS, values):
+                column = self.columns[name]
+                column[i] = column[i + self.capacity] = value
+            self.next = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.total += 1
+
+    def __len__(self):
+        return self.count
+
+    def window(self, field, count=None):
+        """
+        Returns a zero-copy memoryview of the last count samples of a field (all held samples by default),
+        oldest first. It looks straight at the ring, so copy it (e.g. .tolist()) to keep it past later appends.
+        """
+        with self.lock:
+            count = self.count if count is None else min(count, self.count)
+            end = self.next + self.capacity
+            return memoryview(self.columns[field])[end - count:end]
+
+    def since(self, timestamp):
+        """Returns how many of the held samples were taken at or after timestamp, for use with window()."""
+        times = self.window("timestamp")
+        return len(times) - bisect.bisect_left(times, timestamp)
+
+    def latest(self):
+        """Returns the newest sample as a dict, or None if there isn't one yet."""
+        with self.lock:
+            if not self.count:
+                return None
+            i = self.next - 1 + self.capacity
+            return {name: self.columns[name][i] for name in FIELDS}
+
+class Telemetry:
+    """Telemetry rings for every device, created on a device's first sample."""
+
+    def __init__(self, capacity=TELEMETRY_CAPACITY):
+        self.capacity = capacity
+        self.rings = {}
+        self.lock = threading.Lock()
+
+    def ring(self, device):
+        ring = self.rings.get(device)
+        if ring is None:
+            with self.lock:
+                ring = self.rings.setdefault(device, TelemetryRing(self.capacity))
+        return ring
+
+    def record(self, device, timestamp, skin_temp=None, target=None, error=None, integral=None,
+               thermal=None, vibration=None, led=None):
+        """Appends one tick's sample for a device and returns its values; None fields are stored as NaN."""
+        values = (timestamp, nan_if_none(skin_temp), nan_if_none(target), nan_if_none(error),
+                  nan_if_none(integral), nan_if_none(thermal), nan_if_none(vibration), pack_led(led))
+        self.ring(device).append(*values)
+        return values
+
+    def clear(self):
+        with self.lock:
+            self.rings.clear()
+
+def nan_if_none(value):
+    return math.nan if value is None else value
+
+# Session files: MAGIC, a little-endian uint32 header length and a JSON header naming the session,
+# its devices and FIELDS, then chunks appended one after another. A chunk is CHUNK_HEADER followed by
+# its columns: the device index of each row as uint16, then each field, timestamps as float64 and the
+# rest as float32. A chunk cut short by a crash is ignored by the reader.
+MAGIC = b"DOTTLM1\n"
+CHUNK_HEADER = struct.Struct("<4sIdd")  # b"CHNK", rows, first timestamp, last timestamp
+CHUNK_ROWS = 4096      # Rows buffered before a chunk is written
+CHUNK_SECONDS = 5.0    # A partial chunk is written after this long anyway
+FSYNC_INTERVAL = 10.0  # Seconds between fsyncs of the session file
+
+def column_type(field):
+    return "d" if field == "timestamp" else "f"
+
+def chunk_size(rows):
+    """Bytes a chunk of rows takes up, header included."""
+    return CHUNK_HEADER.size + rows * (2 + sum(array(column_type(field)).itemsize for field in FIELDS))
+
+class SessionRecorder:
+    """
+    Streams a session's telemetry to an append-only session file. record() only queues the sample;
+    a background thread batches samples into columnar chunks, writes them and fsyncs periodically,
+    so the control tick never waits on the disk.
+    """
+
+    def __init__(self, path, devices, name=""):
+        self.path = path
+        self.devices = list(devices)  # Device identities; rows refer to them by index
+        self.samples = queue.SimpleQueue()
+        self.chunks = 0
+        self.rows = 0
+        self.file = open(path, "wb")
+        header = json.dumps({"name": name, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                             "devices": self.devices, "fields": FIELDS}).encode()
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.thread = threading.Thread(target=self.run, daemon=True, name="recorder")
+        self.thread.start()
+
+    def record(self, index, values):
+        """Queues one sample (a value for each of FIELDS) for the device at index; never blocks."""
+        self.samples.put((index, values))
+
+    def run(self):
+        pending = []
+        last_write = last_sync = time.monotonic()
+        while True:
+            try:
+                sample = self.samples.get(timeout=CHUNK_SECONDS)
+            except queue.Empty:
+                sample = ()
+            if sample:
+                pending.append(sample)
+            now = time.monotonic()
+            if pending and (sample is None or len(pending) >= CHUNK_ROWS or now - last_write >= CHUNK_SECONDS):
+                self.write_chunk(pending)
+                pending = []
+                last_write = now
+            if sample is None or now - last_sync >= FSYNC_INTERVAL:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                last_sync = now
+            if sample is None:
+                self.file.close()
+                return
+
+    def write_chunk(self, samples):
+        timestamps = [values[0] for index, values in samples]
+        parts = [CHUNK_HEADER.pack(b"CHNK", len(samples), min(timestamps), max(timestamps)),
+                 array("H", [index for index, values in samples]).tobytes()]
+        for i, field in enumerate(FIELDS):
+            parts.append(array(column_type(field), [values[i] for index, values in samples]).tobytes())
+        self.file.write(b"".join(parts))
+        self.chunks += 1
+        self.rows += len(samples)
+
+    def close(self, wait=True):
+        """Writes whatever is still queued, fsyncs and closes the file; waits for that unless wait is False."""
+        if self.thread.is_alive():
+            self.samples.put(None)
+            if wait:
+                self.thread.join()
+
+class SessionReader:
+    """
+    Memory-maps a session file and indexes its chunks by time, so any stretch of a long session
+    can be read without loading the rest. Column views point straight into the mapping.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a DotCode session file")
+        length, = struct.unpack_from("<I", self.map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.map[start:start + length])
+        self.devices = self.header["devices"]
+        self.index = []  # (first timestamp, last timestamp, offset, rows) of every complete chunk
+        offset = start + length
+        while offset + CHUNK_HEADER.size <= len(self.map):
+            tag, rows, first, last = CHUNK_HEADER.unpack_from(self.map, offset)
+            if tag != b"CHNK" or offset + chunk_size(rows) > len(self.map):
+                break  # Cut short by a crash
+            self.index.append((first, last, offset, rows))
+            offset += chunk_size(rows)
+
+    def chunk(self, i):
+        """Returns {"device": indices, field: values} for chunk i as zero-copy memoryviews."""
+        first, last, offset, rows = self.index[i]
+        view = memoryview(self.map)
+        offset += CHUNK_HEADER.size
+        columns = {"device": view[offset:offset + 2 * rows].cast("H")}
+        offset += 2 * rows
+        for field in FIELDS:
+            size = rows * array(column_type(field)).itemsize
+            columns[field] = view[offset:offset + size].cast(column_type(field))
+            offset += size
+        return columns
+
+    def chunks(self, start=-math.inf, end=math.inf):
+        """Yields the columns of every chunk that overlaps the time range [start, end]."""
+        first_chunk = bisect.bisect_left([last for first, last, offset, rows in self.index], start)
+        for i in range(first_chunk, len(self.index)):
+            if self.index[i][0] > end:
+                break
+            yield self.chunk(i)
+
+    def samples(self, start=-math.inf, end=math.inf, device=None):
+        """Yields the samples taken in [start, end] as dicts, for one device identity or all of them."""
+        wanted = None if device is None else self.devices.index(device)
+        for columns in self.chunks(start, end):
+            for row, timestamp in enumerate(columns["timestamp"]):
+                if start <= timestamp <= end and (wanted is None or columns["device"][row] == wanted):
+                    sample = {field: columns[field][row] for field in FIELDS}
+                    sample["device"] = self.devices[columns["device"][row]]
+                    yield sample
+
+    def close(self):
+        self.map.close()
+        self.file.close()